@@ -0,0 +1,152 @@
+# api/job_queue.py
+# PDF 处理任务队列: 有界的等待队列 + 进程池
+# 处理在独立的 worker 进程中运行, 不占用 Web 进程的线程池和 GIL;
+# 等待队列满时拒绝新任务 (由 services 层转换为 HTTP 429)。
+# worker 进程异常退出 (OOM、PyMuPDF 崩溃) 会使进程池损坏, 此时丢弃进程池, 后续任务使用新的进程池。
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "20"))
+
+
+class QueueFullError(Exception):
+    """等待队列已满。"""
+
+
+def _warm_up():
+    """在 worker 进程中执行的空任务, 用于提前启动 worker 进程。"""
+
+
+class JobQueue:
+    """
+    先进先出的任务调度器。
+    最多 max_workers 个任务同时在 worker 进程中运行, 其余任务在父进程中排队, 最多 max_depth 个。
+    任务开始和结束时在父进程中调用 on_start(task_id) 和 on_done(task_id, result, error)。
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_depth=JOB_QUEUE_MAX_DEPTH, on_start=None, on_done=None):
+        self.max_workers = max(1, max_workers)
+        self.max_depth = max_depth
+        self.on_start = on_start
+        self.on_done = on_done
+        self._waiting = deque()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: 不把 Web 进程的线程和事件循环状态 fork 到 worker 中
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """
+        丢弃已损坏的进程池, 下次提交时创建新的进程池。
+        损坏的进程池已自行终止其 worker 进程, 无需 shutdown。
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def start(self):
+        """
+        创建进程池并启动全部 worker 进程, 在应用启动时调用, 避免在处理上传请求时启动进程。
+        """
+        executor = self._get_executor()
+        for _ in range(self.max_workers):
+            executor.submit(_warm_up)
+
+    def is_full(self):
+        with self._lock:
+            return len(self._waiting) >= self.max_depth
+
+    def submit(self, task_id, fn, *args):
+        """
+        提交任务, fn 和参数必须可以被 pickle 传给 worker 进程。
+        队列已满时抛出 QueueFullError。
+        """
+        with self._lock:
+            if len(self._waiting) >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_depth} tasks waiting).")
+            self._waiting.append((task_id, fn, args))
+        self._dispatch()
+
+    def position(self, task_id):
+        """
+        返回任务在等待队列中的位置 (从 1 开始), 正在运行时返回 0, 不在队列中返回 None。
+        """
+        with self._lock:
+            if task_id in self._running:
+                return 0
+            for index, (waiting_task_id, _, _) in enumerate(self._waiting):
+                if waiting_task_id == task_id:
+                    return index + 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._running), "waiting": len(self._waiting),
+                    "max_workers": self.max_workers, "max_depth": self.max_depth}
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if len(self._running) >= self.max_workers or not self._waiting:
+                    return
+                task_id, fn, args = self._waiting.popleft()
+                self._running.add(task_id)
+            if self.on_start:
+                self.on_start(task_id)
+            try:
+                executor, future = self._submit(fn, args)
+            except Exception as e:
+                self._finish(task_id, None, e)
+                continue
+            future.add_done_callback(
+                lambda done, task_id=task_id, executor=executor: self._on_future_done(task_id, executor, done))
+
+    def _submit(self, fn, args):
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # 进程池刚刚损坏, 尚未由回调丢弃: 换一个新的进程池重新提交
+            self._reset_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(fn, *args)
+
+    def _on_future_done(self, task_id, executor, future):
+        try:
+            result, error = future.result(), None
+        except BrokenProcessPool as e:
+            # worker 进程异常退出, 该进程池中正在运行的任务都以失败结束, 后续任务使用新的进程池
+            self._reset_executor(executor)
+            result, error = None, e
+        except Exception as e:
+            result, error = None, e
+        self._finish(task_id, result, error)
+        self._dispatch()
+
+    def _finish(self, task_id, result, error):
+        with self._lock:
+            self._running.discard(task_id)
+        if self.on_done:
+            try:
+                self.on_done(task_id, result, error)
+            except Exception as e:
+                print(f"Task {task_id}: Error in job completion callback: {e}")
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._waiting.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,35 @@
+# api/metrics.py
+# API 服务的 Prometheus 指标, 由 GET /metrics 以文本格式输出
+# LLM 请求和各阶段耗时的指标在 worker 进程中记录 (app/utils/metrics_utils.py), 由 services 定期合并到本进程;
+# 每个 uvicorn worker 进程只输出自己的指标。
+from app.utils.metrics_utils import REGISTRY, Counter, Gauge, Histogram, llm_cache_hit_ratio
+
+UPLOADS = Counter("pageindex_uploads_total",
+                  "PDF uploads by result (queued, deduplicated, queue_full or too_large).", ["result"])
+UPLOAD_BYTES = Counter("pageindex_upload_bytes_total", "Bytes of accepted PDF uploads.")
+TASKS_FINISHED = Counter("pageindex_tasks_finished_total", "Finished processing tasks by status.", ["status"])
+TASK_DURATION = Histogram("pageindex_task_duration_seconds",
+                          "Processing time of a task in a worker process, by final status.", ["status"])
+TASK_QUEUE_WAIT = Histogram("pageindex_task_queue_wait_seconds", "Time a task waited in the job queue.")
+
+JOB_QUEUE_WAITING = Gauge("pageindex_job_queue_waiting", "Tasks waiting in the job queue.")
+JOB_QUEUE_RUNNING = Gauge("pageindex_job_queue_running", "Tasks being processed by worker processes.")
+JOB_QUEUE_WORKERS = Gauge("pageindex_job_queue_workers", "Worker processes of the job queue.")
+JOB_QUEUE_MAX_DEPTH = Gauge("pageindex_job_queue_max_depth", "Tasks the job queue accepts before rejecting uploads.")
+LLM_CACHE_HIT_RATIO = Gauge("pageindex_llm_cache_hit_ratio",
+                            "Share of LLM requests answered from the response cache since the start.")
+LLM_CACHE_HIT_RATIO.set_function(llm_cache_hit_ratio)
+
+
+def bind_job_queue(job_queue):
+    """
+    队列相关的 gauge 在输出时读取 job_queue 的当前状态。
+    """
+    JOB_QUEUE_WAITING.set_function(lambda: job_queue.stats()["waiting"])
+    JOB_QUEUE_RUNNING.set_function(lambda: job_queue.stats()["running"])
+    JOB_QUEUE_WORKERS.set_function(lambda: job_queue.stats()["max_workers"])
+    JOB_QUEUE_MAX_DEPTH.set_function(lambda: job_queue.stats()["max_depth"])
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
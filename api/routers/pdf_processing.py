@@ -1,7 +1,7 @@
 # api/routers/pdf_processing.py
 from pathlib import Path
-from fastapi import APIRouter, File, UploadFile, BackgroundTasks, HTTPException, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Request, Header
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
 from api import services 
 
@@ -10,9 +10,8 @@ router = APIRouter(
     tags=["PDF Processing"], # API add tags for better organization
 )
 
-@router.post("/upload/", summary="Upload PDF for Processing")
+@router.post("/upload/", summary="Upload PDF for Processing", name="upload_pdf_for_processing_endpoint")
 async def upload_pdf_for_processing_endpoint(
-    background_tasks: BackgroundTasks,
     pdf_file: UploadFile = File(..., description="The PDF file to process."),
     model: str = Query('deepseek-chat', description="Model to use for processing."),
     toc_check_pages: int = Query(20, description="Number of pages to check for table of contents."),
@@ -34,26 +33,30 @@ async def upload_pdf_for_processing_endpoint(
         "if_add_node_text": if_add_node_text
     }
 
-    task_id, temp_pdf_path, original_filename, processed_opt_params = await services.create_processing_task(
+    task_id, temp_pdf_path, original_filename, processed_opt_params, file_sha256, deduplicated = await services.create_processing_task(
         pdf_file,
         opt_params_dict
     )
 
-    # add the background task to process the PDF
-    background_tasks.add_task(
-        services.run_pdf_processing_task,
-        task_id,
-        temp_pdf_path,
-        original_filename,
-        processed_opt_params # pass the processed options
-    )
+    # queue the PDF for processing, unless an identical upload is already processed or done
+    if not deduplicated:
+        await services.submit_processing_task(
+            task_id,
+            temp_pdf_path,
+            original_filename,
+            processed_opt_params # pass the processed options
+        )
 
     return {
-        "message": "PDF processing started in the background.",
+        "message": "Identical PDF already submitted, reusing its task." if deduplicated else "PDF queued for processing.",
+        "deduplicated": deduplicated,
         "task_id": task_id,
         "filename": original_filename,
+        "sha256": file_sha256,
         "status_url": router.url_path_for("get_task_status_endpoint", task_id=task_id),
-        "results_url": router.url_path_for("get_processing_result_endpoint", task_id=task_id)
+        "progress_url": router.url_path_for("get_task_progress_endpoint", task_id=task_id),
+        "results_url": router.url_path_for("get_processing_result_endpoint", task_id=task_id),
+        "trace_url": router.url_path_for("get_task_trace_endpoint", task_id=task_id)
     }
 
 @router.get("/status/{task_id}", summary="Get Task Status", name="get_task_status_endpoint")
@@ -61,6 +64,16 @@ async def get_task_status_endpoint(task_id: str):
     status_info = await services.get_task_status_by_id(task_id)
     return status_info
 
+@router.get("/progress/{task_id}", summary="Stream Task Progress", name="get_task_progress_endpoint")
+async def get_task_progress_endpoint(task_id: str, request: Request, last_event_id: int = Header(0)):
+    # Server-Sent Events: "progress" events for every stage transition, then a final "status" event
+    await services.get_task_status_by_id(task_id) # 404 for unknown tasks
+    return StreamingResponse(
+        services.stream_task_progress(task_id, last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/results/{task_id}", summary="Get Processing Result", name="get_processing_result_endpoint")
 async def get_processing_result_endpoint(task_id: str):
     try:
@@ -73,4 +86,17 @@ async def get_processing_result_endpoint(task_id: str):
     except HTTPException as e:
         # error post-processing, such as file not found or task failed
         # feed the error back to the client
-        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
\ No newline at end of file
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+@router.get("/trace/{task_id}", summary="Get Task Timing and LLM Usage", name="get_task_trace_endpoint")
+async def get_task_trace_endpoint(
+    task_id: str,
+    format: str = Query('report', pattern='^(report|otlp)$', description="'report' (per-stage summary) or 'otlp' (OpenTelemetry OTLP/JSON spans).")
+):
+    try:
+        trace = await services.get_trace_by_task_id(task_id, format)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+    if format == 'otlp':
+        return FileResponse(path=trace, filename=f"{task_id}_trace.json", media_type='application/json')
+    return trace
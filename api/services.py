@@ -1,15 +1,26 @@
 # api/services.py
 import os
 import json
-import shutil
+import time
 import uuid
+import socket
+import threading
+import multiprocessing
+import asyncio
+import hashlib
 from pathlib import Path
 
-from fastapi import HTTPException # BackgroundTasks 会在 router 层传入
+from fastapi import HTTPException
 
 # 核心应用逻辑导入
 from app.core.document_parser import page_index_main
-from app.utils.config_utils import config # 确保导入路径正确
+from app.utils.config_utils import ConfigLoader # 确保导入路径正确
+from app.utils.progress_utils import progress_reporter
+from app.utils.tracing_utils import Tracer
+from app.utils.metrics_utils import REGISTRY, observe_trace_report
+from api.job_queue import JobQueue, QueueFullError
+from api import metrics
+from api.task_store import ACTIVE_STATUSES, create_task_store
 
 # --- 目录定义 ---
 BASE_API_DIR = Path(__file__).resolve().parent # api/ 目录
@@ -22,60 +33,185 @@ RESULTS_DIR = PROJECT_ROOT_DIR / "api_results"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-# --- 任务状态管理 (内存中) ---
-# 生产环境建议使用 Redis 或数据库
-tasks_status = {}
+# --- 上传限制 ---
+# 上传文件按块读取, 写盘和哈希在线程池中执行, 不阻塞事件循环
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+
+# --- 任务状态管理 ---
+# TASK_STORE=sqlite (默认) 时状态保存在 SQLite 中, 重启后保留并在多个 uvicorn worker 间共享
+# 已结束的任务及其结果文件在 TASK_TTL_SECONDS 后被清除
+task_store = create_task_store()
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", str(24 * 3600)))
+TASK_CLEANUP_INTERVAL = int(os.getenv("TASK_CLEANUP_INTERVAL", "600"))
+
+# 处理任务的日志级别和控制台输出 (rich / plain / none), 服务端默认不渲染 Rich 输出
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "none")
+
+# 进度事件流 (SSE) 轮询任务存储的间隔和心跳间隔 (秒)
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+PROGRESS_HEARTBEAT_INTERVAL = 15
+
+# worker 进程把 LLM 请求和阶段耗时指标发送给本进程 (/metrics) 的最小间隔 (秒), 任务结束时总会发送
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", "5"))
+
+# 本进程的任务队列标识, 用于计算排队位置和识别服务重启后中断的任务
+QUEUE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
 
 # --- 辅助函数 ---
 def str_to_bool(value: str) -> bool:
     return value.lower() in ('yes', 'true', 't', '1')
 
+def _write_chunk(buffer, digest, chunk: bytes):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+async def save_upload_file(pdf_file, destination: Path, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    分块保存上传文件, 同时计算 SHA-256。
+    超过 max_bytes 时删除已写入的部分并返回 413。
+    返回文件大小 (字节) 和 SHA-256 十六进制摘要。
+    """
+    digest = hashlib.sha256()
+    size = 0
+    buffer = await asyncio.to_thread(open, destination, "wb")
+    try:
+        while True:
+            chunk = await pdf_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Uploaded file exceeds the limit of {max_bytes} bytes.")
+            await asyncio.to_thread(_write_chunk, buffer, digest, chunk)
+    except Exception:
+        await asyncio.to_thread(buffer.close)
+        await asyncio.to_thread(destination.unlink, True)
+        raise
+    await asyncio.to_thread(buffer.close)
+    return size, digest.hexdigest()
+
+def make_result_key(file_sha256: str, opt_params: dict):
+    """
+    生成结果去重的键: (文件 SHA-256, 规范化后的处理参数, 模型) 的哈希。
+    相同 PDF 以相同参数重复上传时, 直接复用已完成的结果或挂到正在运行的任务上。
+    """
+    options = {key: value for key, value in opt_params.items() if key != "model"}
+    normalized_options = json.dumps(options, sort_keys=True, ensure_ascii=False)
+    key = json.dumps([file_sha256, normalized_options, opt_params.get("model")], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def is_reusable_task(status_info: dict) -> bool:
+    """
+    可以复用的任务: 已完成且结果文件存在, 或者仍在排队/处理中。
+    失败的任务或结果文件丢失的任务不会被复用。
+    """
+    if status_info["status"] == "completed":
+        return Path(status_info.get("result_path", "")).is_file()
+    return status_info["status"] in ACTIVE_STATUSES
+
+def get_trace_path(task_id: str) -> Path:
+    # 任务的阶段和 LLM 调用 span, OpenTelemetry OTLP/JSON 格式
+    return RESULTS_DIR / f"{task_id}_trace.json"
+
+def is_queue_owner_alive(queue_owner: str) -> bool:
+    # 其他主机上的队列无法检查, 视为存活
+    hostname, _, pid = (queue_owner or "").rpartition(":")
+    if hostname != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def cleanup_expired_tasks():
+    """
+    删除超过 TTL 的已结束任务及其结果文件, 并将所属进程已退出的未完成任务标记为失败。
+    """
+    interrupted = task_store.fail_interrupted(is_queue_owner_alive)
+    if interrupted:
+        print(f"Marked {interrupted} interrupted tasks as failed.")
+    for status_info in task_store.evict_finished(TASK_TTL_SECONDS):
+        result_path = status_info.get("result_path")
+        if result_path:
+            Path(result_path).unlink(missing_ok=True)
+        get_trace_path(status_info["task_id"]).unlink(missing_ok=True)
+        print(f"Task {status_info['task_id']}: Evicted after {TASK_TTL_SECONDS}s.")
+
+async def run_task_cleanup_loop():
+    """
+    定期清理过期任务, 在应用启动时作为后台任务运行。
+    """
+    while True:
+        try:
+            await asyncio.to_thread(cleanup_expired_tasks)
+        except Exception as e:
+            print(f"Error cleaning up expired tasks: {e}")
+        await asyncio.sleep(TASK_CLEANUP_INTERVAL)
+
 # --- PDF 处理核心服务 ---
 def run_pdf_processing_task(
     task_id: str,
     pdf_path: Path,
     original_filename: str,
-    opt_params: dict # 包含已转换为布尔值的参数
+    opt_params: dict, # 包含已转换为布尔值的参数
+    progress_queue=None,
+    metrics_queue=None
 ):
     """
-    在后台执行 PDF 处理。
-    此函数由 BackgroundTasks 调用。
+    在 worker 进程中执行 PDF 处理。
+    此函数由 job_queue 在进程池中调用, 不直接修改任务状态,
+    成功时返回结果文件路径和耗时报告 (trace report), 失败时抛出异常, 状态由父进程的回调更新。
+    处理过程中的进度事件通过 progress_queue 发送给父进程, 本进程记录的指标增量通过 metrics_queue 发送。
+    无论成功与否, 各阶段和 LLM 调用的 span 都写入 get_trace_path(task_id)。
     """
-    current_status = tasks_status.get(task_id, {})
-    current_status.update({"status": "processing", "filename": original_filename, "details": "Initializing PDF processing..."})
-    tasks_status[task_id] = current_status
-
     print(f"Task {task_id}: Starting processing for {original_filename} with options: {opt_params}")
 
-    try:
-        # 调用项目核心的 config 和 page_index_main
-        processing_options = config(**opt_params)
+    last_metrics_push = time.monotonic()
 
-        tasks_status[task_id]["details"] = "Core processing started..."
-        toc_with_page_number = page_index_main(str(pdf_path), processing_options)
+    def push_metrics(force=False):
+        nonlocal last_metrics_push
+        if metrics_queue is None or (not force and time.monotonic() - last_metrics_push < METRICS_PUSH_INTERVAL):
+            return
+        last_metrics_push = time.monotonic()
+        delta = REGISTRY.take_delta()
+        if delta:
+            metrics_queue.put(delta)
 
-        tasks_status[task_id]["details"] = "Processing complete, saving results..."
+    def report(event):
+        if progress_queue is not None:
+            progress_queue.put((task_id, event))
+        push_metrics()
+
+    tracer = Tracer()
+    try:
+        # 调用项目核心的 config 和 page_index_main
+        processing_options = ConfigLoader().load({**opt_params, "log_level": LOG_LEVEL, "log_console": LOG_CONSOLE})
+        with progress_reporter(report):
+            toc_with_page_number = page_index_main(str(pdf_path), processing_options, tracer=tracer)
 
         pdf_name_base = Path(original_filename).stem
-        result_filename = f"{pdf_name_base}_structure.json"
+        # 结果文件以 task_id 区分, 同名但内容不同的 PDF 不会互相覆盖
+        result_filename = f"{task_id}_{pdf_name_base}_structure.json"
         result_filepath = RESULTS_DIR / result_filename
 
         with open(result_filepath, 'w', encoding='utf-8') as f:
             json.dump(toc_with_page_number, f, indent=2, ensure_ascii=False)
 
-        tasks_status[task_id].update({
-            "status": "completed",
-            "result_path": str(result_filepath),
-            "details": "Results saved successfully."
-        })
         print(f"Task {task_id}: Completed successfully. Result at {result_filepath}")
-
-    except Exception as e:
-        error_message = f"Error during PDF processing for task {task_id}: {str(e)}"
-        tasks_status[task_id].update({"status": "failed", "error": error_message})
-        print(error_message)
+        return str(result_filepath), tracer.report()
 
     finally:
+        try:
+            tracer.export_otlp(get_trace_path(task_id))
+        except OSError as e_trace:
+            print(f"Task {task_id}: Error writing trace file: {e_trace}")
+        observe_trace_report(tracer.report())
+        push_metrics(force=True)
         # 清理上传的临时文件
         if pdf_path.exists():
             try:
@@ -84,14 +220,144 @@ def run_pdf_processing_task(
             except OSError as e_remove:
                 print(f"Task {task_id}: Error cleaning up temporary file {pdf_path}: {e_remove}")
 
+# --- 任务队列回调 (在父进程中执行) ---
+# 任务的提交和开始时间 (time.monotonic), 用于排队时间和处理时间指标
+_task_times = {}
+
+def _on_job_started(task_id: str):
+    now = time.monotonic()
+    submitted_at = _task_times.pop(task_id, now)
+    _task_times[task_id] = now
+    metrics.TASK_QUEUE_WAIT.observe(now - submitted_at)
+    task_store.transition(task_id, ["pending"], "processing", details="Core processing started...")
+
+def _on_job_done(task_id: str, result, error):
+    started_at = _task_times.pop(task_id, None)
+    status = "completed" if error is None else "failed"
+    metrics.TASKS_FINISHED.inc(status=status)
+    if started_at is not None:
+        metrics.TASK_DURATION.observe(time.monotonic() - started_at, status=status)
+
+    if error is None:
+        result_path, trace_report = result
+        task_store.transition(task_id, ["processing"], "completed",
+                              result_path=result_path, trace=trace_report, details="Results saved successfully.")
+    else:
+        error_message = f"Error during PDF processing for task {task_id}: {str(error)}"
+        task_store.transition(task_id, ["processing"], "failed", error=error_message)
+        print(error_message)
+
+job_queue = JobQueue(on_start=_on_job_started, on_done=_on_job_done)
+metrics.bind_job_queue(job_queue)
+
+# --- 进度事件和指标 ---
+# worker 进程把进度事件和指标增量放入 Manager 队列, 父进程中的线程分别把它们写入任务存储和合并到本进程的指标,
+# 任何 uvicorn worker 都可以从任务存储中读取进度事件并推送给客户端
+_worker_queues_lock = threading.Lock()
+_worker_manager = None
+_worker_queues = None
+
+def _get_worker_queues():
+    """返回 (progress_queue, metrics_queue), 首次调用时启动 Manager 和消费线程。"""
+    global _worker_manager, _worker_queues
+    with _worker_queues_lock:
+        if _worker_queues is None:
+            _worker_manager = multiprocessing.get_context("spawn").Manager()
+            _worker_queues = (_worker_manager.Queue(), _worker_manager.Queue())
+            threading.Thread(target=_consume_progress_events, args=(_worker_queues[0],), daemon=True).start()
+            threading.Thread(target=_consume_worker_metrics, args=(_worker_queues[1],), daemon=True).start()
+    return _worker_queues
+
+def _consume_progress_events(progress_queue):
+    while True:
+        try:
+            item = progress_queue.get()
+        except (EOFError, OSError):
+            return
+        if item is None:
+            return
+        task_id, event = item
+        try:
+            task_store.add_event(task_id, event)
+        except Exception as e:
+            print(f"Task {task_id}: Error saving progress event: {e}")
+
+def _consume_worker_metrics(metrics_queue):
+    while True:
+        try:
+            delta = metrics_queue.get()
+        except (EOFError, OSError):
+            return
+        if delta is None:
+            return
+        try:
+            REGISTRY.merge_delta(delta)
+        except Exception as e:
+            print(f"Error merging worker metrics: {e}")
+
+def start():
+    """
+    在应用启动时启动 Manager (进度事件和指标队列) 和进程池的 worker 进程,
+    处理上传请求时不再在事件循环中启动进程。
+    """
+    _get_worker_queues()
+    job_queue.start()
+
+def shutdown():
+    """停止任务队列以及进度事件和指标队列。"""
+    global _worker_manager, _worker_queues
+    job_queue.shutdown()
+    with _worker_queues_lock:
+        if _worker_queues is not None:
+            for worker_queue in _worker_queues:
+                worker_queue.put(None)
+            _worker_manager.shutdown()
+            _worker_manager = None
+            _worker_queues = None
+
+async def submit_processing_task(
+    task_id: str,
+    pdf_path: Path,
+    original_filename: str,
+    opt_params: dict
+):
+    """
+    将任务放入处理队列。队列已满时删除上传文件和任务状态并返回 429。
+    提交时可能写任务存储 (on_start 中的 SQLite 事务) 或重建进程池, 在线程中执行, 不阻塞事件循环。
+    """
+    progress_queue, metrics_queue = await asyncio.to_thread(_get_worker_queues)
+    _task_times[task_id] = time.monotonic()
+    try:
+        await asyncio.to_thread(job_queue.submit, task_id, run_pdf_processing_task, task_id, pdf_path,
+                                original_filename, opt_params, progress_queue, metrics_queue)
+    except QueueFullError as e:
+        _task_times.pop(task_id, None)
+        await asyncio.to_thread(_discard_task, task_id, pdf_path)
+        metrics.UPLOADS.inc(result="queue_full")
+        raise HTTPException(status_code=429, detail=f"{e} Please retry later.", headers={"Retry-After": "30"})
+    metrics.UPLOADS.inc(result="queued")
+
+def _discard_task(task_id: str, pdf_path: Path):
+    task_store.delete(task_id)
+    pdf_path.unlink(missing_ok=True)
+
+def queue_full_error() -> HTTPException:
+    metrics.UPLOADS.inc(result="queue_full")
+    return HTTPException(status_code=429, detail="Job queue is full. Please retry later.", headers={"Retry-After": "30"})
+
 async def create_processing_task(
     pdf_file, # UploadFile object
     opt_params_dict: dict # 包含 API 传入的原始参数
 ):
     """
     创建并初始化一个新的 PDF 处理任务。
-    返回 task_id 和原始文件名。
+    如果相同内容和参数的任务已完成或正在处理, 则复用该任务, 不再重复处理。
+    返回 task_id, 临时文件路径, 原始文件名, 处理参数, 文件 SHA-256 以及是否复用了已有任务。
     """
+    # 队列已满时在保存文件之前拒绝 (请求体在此之前已被解析, 在读取请求体之前的拒绝由 api_main 的 RejectUploadIfQueueFull 完成)
+    if job_queue.is_full():
+        raise queue_full_error()
+
     task_id = str(uuid.uuid4())
     original_filename = pdf_file.filename if pdf_file.filename else "uploaded_file.pdf"
 
@@ -99,13 +365,17 @@ async def create_processing_task(
     temp_pdf_path = UPLOAD_DIR / safe_filename
 
     try:
-        with open(temp_pdf_path, "wb") as buffer:
-            shutil.copyfileobj(pdf_file.file, buffer)
-        print(f"File {original_filename} uploaded as {temp_pdf_path} for task {task_id}")
+        file_size, file_sha256 = await save_upload_file(pdf_file, temp_pdf_path)
+        print(f"File {original_filename} ({file_size} bytes, sha256 {file_sha256}) uploaded as {temp_pdf_path} for task {task_id}")
+        metrics.UPLOAD_BYTES.inc(file_size)
+    except HTTPException as e:
+        if e.status_code == 413:
+            metrics.UPLOADS.inc(result="too_large")
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save uploaded file: {str(e)}")
     finally:
-        pdf_file.file.close()
+        await pdf_file.close()
 
     # 转换布尔参数
     processed_opt_params = {
@@ -119,21 +389,69 @@ async def create_processing_task(
         "if_add_node_text": str_to_bool(opt_params_dict['if_add_node_text'])
     }
 
-    # 初始化任务状态
-    tasks_status[task_id] = {
+    # 初始化任务状态; 相同内容和参数的任务已存在时直接复用, 删除刚上传的文件
+    new_status = {
         "status": "pending",
         "filename": original_filename,
-        "details": "Task accepted, waiting for background processing to start."
+        "sha256": file_sha256,
+        "details": "Task accepted, waiting in the processing queue."
     }
+    result_key = make_result_key(file_sha256, processed_opt_params)
+    existing_task_id = await asyncio.to_thread(
+        task_store.create_or_reuse, task_id, new_status, result_key, QUEUE_OWNER, is_reusable_task
+    )
+    if existing_task_id is not None:
+        await asyncio.to_thread(temp_pdf_path.unlink, True)
+        print(f"File {original_filename} matches task {existing_task_id}, reusing its result")
+        metrics.UPLOADS.inc(result="deduplicated")
+        return existing_task_id, None, original_filename, processed_opt_params, file_sha256, True
 
-    return task_id, temp_pdf_path, original_filename, processed_opt_params
+    return task_id, temp_pdf_path, original_filename, processed_opt_params, file_sha256, False
 
 async def get_task_status_by_id(task_id: str):
-    status_info = tasks_status.get(task_id)
+    status_info = await asyncio.to_thread(task_store.get, task_id)
     if not status_info:
         raise HTTPException(status_code=404, detail="Task not found.")
+    if status_info["status"] == "pending":
+        # 排队中的任务返回其在所属队列中的位置 (从 1 开始), 任何 worker 进程都可以查询
+        queue_position = await asyncio.to_thread(task_store.queue_position, task_id)
+        return {**status_info, "queue_position": queue_position}
     return status_info
 
+def _format_sse(event: str, data: dict, event_id=None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, ensure_ascii=False)}"]
+    return "\n".join(lines) + "\n\n"
+
+async def stream_task_progress(task_id: str, last_event_id: int = 0, is_disconnected=None):
+    """
+    以 Server-Sent Events 格式推送任务的进度事件 (event: progress),
+    任务结束后推送最终状态 (event: status) 并结束。
+    last_event_id 用于断线重连时跳过已收到的事件。
+    """
+    last_sent = time.monotonic()
+    while True:
+        events = await asyncio.to_thread(task_store.get_events, task_id, last_event_id)
+        for event_id, event in events:
+            yield _format_sse("progress", event, event_id)
+            last_event_id = event_id
+            last_sent = time.monotonic()
+
+        status_info = await asyncio.to_thread(task_store.get, task_id)
+        if status_info is None or status_info["status"] in ("completed", "failed"):
+            # 任务结束后再取一次, 避免漏掉结束前写入的事件
+            for event_id, event in await asyncio.to_thread(task_store.get_events, task_id, last_event_id):
+                yield _format_sse("progress", event, event_id)
+            yield _format_sse("status", status_info or {"task_id": task_id, "status": "not_found"})
+            return
+
+        if is_disconnected is not None and await is_disconnected():
+            return
+        if time.monotonic() - last_sent >= PROGRESS_HEARTBEAT_INTERVAL:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
 async def get_result_file_by_task_id(task_id: str):
     status_info = await get_task_status_by_id(task_id) # 复用状态获取逻辑
 
@@ -148,4 +466,22 @@ async def get_result_file_by_task_id(task_id: str):
     elif status_info["status"] == "failed":
         raise HTTPException(status_code=500, detail=f"Processing failed: {status_info.get('error')}")
     else: # pending or processing
-        raise HTTPException(status_code=202, detail=f"Processing not yet complete. Status: {status_info['status']}")
\ No newline at end of file
+        raise HTTPException(status_code=202, detail=f"Processing not yet complete. Status: {status_info['status']}")
+
+async def get_trace_by_task_id(task_id: str, trace_format: str = "report"):
+    """
+    返回任务的耗时报告 (format=report, 各阶段耗时与 LLM 调用次数、token、重试、缓存命中),
+    或 OpenTelemetry OTLP/JSON 格式的 span 文件路径 (format=otlp)。失败的任务只有 span 文件。
+    """
+    status_info = await get_task_status_by_id(task_id)
+    if status_info["status"] in ACTIVE_STATUSES:
+        raise HTTPException(status_code=202, detail=f"Processing not yet complete. Status: {status_info['status']}")
+
+    if trace_format == "otlp":
+        trace_path = get_trace_path(task_id)
+        if not trace_path.exists():
+            raise HTTPException(status_code=404, detail="Trace file not found.")
+        return trace_path
+    if not status_info.get("trace"):
+        raise HTTPException(status_code=404, detail="Trace report not available, try format=otlp.")
+    return {"task_id": task_id, "status": status_info["status"], "trace": status_info["trace"]}
@@ -0,0 +1,355 @@
+# api/task_store.py
+# 任务状态存储: 内存实现 (单进程) 和 SQLite 实现 (重启后保留, 多个 uvicorn worker 共享)
+# 状态迁移是原子的: 只有当前状态符合预期时才会修改, 已结束的任务在 TTL 到期后被清除。
+import os
+import abc
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+TASK_STORE = os.getenv("TASK_STORE", "sqlite")
+TASK_STORE_PATH = os.getenv("TASK_STORE_PATH", "./cache/task_store.sqlite")
+
+# 任务状态: pending -> processing -> completed / failed
+ACTIVE_STATUSES = ("pending", "processing")
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class TaskStore(abc.ABC):
+    """
+    任务状态存储接口。
+    每个任务是一个 dict, 包含 status 和 filename, sha256, details, error, result_path 等字段。
+    result_key 用于结果去重, queue_owner 标识负责执行该任务的进程。
+    """
+
+    @abc.abstractmethod
+    def create_or_reuse(self, task_id, record, result_key, queue_owner, is_reusable):
+        """
+        原子地查找可复用的任务, 找不到时创建新任务。
+        Args:
+            record (dict): 新任务的字段, 必须包含 status。
+            result_key (str): 结果去重的键。
+            queue_owner (str): 负责执行新任务的进程。
+            is_reusable (callable): 判断一个已有任务是否可以复用。
+        Returns:
+            str: 被复用的任务 ID, 创建了新任务时返回 None。
+        """
+
+    @abc.abstractmethod
+    def get(self, task_id):
+        """返回任务的 dict, 不存在时返回 None。"""
+
+    @abc.abstractmethod
+    def transition(self, task_id, from_statuses, to_status, **fields):
+        """
+        仅当任务当前状态在 from_statuses 中时, 将其改为 to_status 并更新 fields。
+        Returns:
+            bool: 是否完成了迁移。
+        """
+
+    @abc.abstractmethod
+    def delete(self, task_id):
+        """删除任务及其进度事件。"""
+
+    @abc.abstractmethod
+    def add_event(self, task_id, event):
+        """保存一个进度事件 (dict), 事件 ID 全局递增。"""
+
+    @abc.abstractmethod
+    def get_events(self, task_id, after_id=0):
+        """
+        Returns:
+            list: 事件 ID 大于 after_id 的 (event_id, event) 列表, 按 ID 排序。
+        """
+
+    @abc.abstractmethod
+    def queue_position(self, task_id):
+        """
+        返回排队任务在其所属队列中的位置 (从 1 开始), 任务不在排队时返回 None。
+        """
+
+    @abc.abstractmethod
+    def fail_interrupted(self, is_owner_alive):
+        """
+        将所属进程已退出的 pending/processing 任务标记为失败, 返回受影响的任务数。
+        """
+
+    @abc.abstractmethod
+    def evict_finished(self, ttl_seconds):
+        """
+        删除结束时间早于 ttl_seconds 之前的任务。
+        Returns:
+            list: 被删除的任务 dict, 便于调用方清理结果文件。
+        """
+
+
+class InMemoryTaskStore(TaskStore):
+    """只在当前进程中有效的任务存储, 适用于单 worker 部署和开发。"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._events = {}
+        self._last_event_id = 0
+        self._lock = threading.Lock()
+
+    def create_or_reuse(self, task_id, record, result_key, queue_owner, is_reusable):
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (existing_id, existing) for existing_id, existing in self._tasks.items()
+                if existing["result_key"] == result_key and existing["status"] != "failed"
+            ]
+            for existing_id, existing in sorted(candidates, key=lambda item: item[1]["created_at"], reverse=True):
+                if is_reusable(self._public(existing)):
+                    return existing_id
+            self._tasks[task_id] = {
+                **record,
+                "task_id": task_id,
+                "result_key": result_key,
+                "queue_owner": queue_owner,
+                "created_at": now,
+                "updated_at": now,
+                "finished_at": None,
+            }
+        return None
+
+    @staticmethod
+    def _public(task):
+        return {key: value for key, value in task.items() if key not in ("result_key", "queue_owner")}
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return self._public(task) if task else None
+
+    def transition(self, task_id, from_statuses, to_status, **fields):
+        now = time.time()
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["status"] not in from_statuses:
+                return False
+            task.update(fields, status=to_status, updated_at=now)
+            if to_status in FINISHED_STATUSES:
+                task["finished_at"] = now
+            return True
+
+    def delete(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._events.pop(task_id, None)
+
+    def add_event(self, task_id, event):
+        with self._lock:
+            self._last_event_id += 1
+            self._events.setdefault(task_id, []).append((self._last_event_id, event))
+
+    def get_events(self, task_id, after_id=0):
+        with self._lock:
+            return [(event_id, event) for event_id, event in self._events.get(task_id, []) if event_id > after_id]
+
+    def queue_position(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["status"] != "pending":
+                return None
+            return sum(
+                1 for other in self._tasks.values()
+                if other["status"] == "pending" and other["queue_owner"] == task["queue_owner"]
+                and other["created_at"] <= task["created_at"]
+            )
+
+    def fail_interrupted(self, is_owner_alive):
+        count = 0
+        for task_id, task in list(self._tasks.items()):
+            if task["status"] in ACTIVE_STATUSES and not is_owner_alive(task["queue_owner"]):
+                count += self.transition(task_id, ACTIVE_STATUSES, "failed", error="Task interrupted by a server restart.")
+        return count
+
+    def evict_finished(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            expired = [
+                task_id for task_id, task in self._tasks.items()
+                if task["status"] in FINISHED_STATUSES and task["finished_at"] is not None and task["finished_at"] < cutoff
+            ]
+            for task_id in expired:
+                self._events.pop(task_id, None)
+            return [self._public(self._tasks.pop(task_id)) for task_id in expired]
+
+
+class SqliteTaskStore(TaskStore):
+    """
+    SQLite 任务存储, 同一台机器上的多个 uvicorn worker 共享同一个文件。
+    status 等需要查询的字段单独成列, 其余字段以 JSON 保存在 data 列中。
+    """
+
+    def __init__(self, path=TASK_STORE_PATH):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # 连接不能在 fork 出的子进程中复用, pid 变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id TEXT PRIMARY KEY, status TEXT NOT NULL, result_key TEXT, queue_owner TEXT, "
+                "data TEXT NOT NULL, created_at REAL, updated_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_result_key ON tasks(result_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, finished_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_events ("
+                "event_id INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_task_events_task ON task_events(task_id, event_id)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _row_to_task(row):
+        task_id, status, data, created_at, updated_at, finished_at = row
+        return {**json.loads(data), "task_id": task_id, "status": status,
+                "created_at": created_at, "updated_at": updated_at, "finished_at": finished_at}
+
+    def create_or_reuse(self, task_id, record, result_key, queue_owner, is_reusable):
+        now = time.time()
+        data = {key: value for key, value in record.items() if key != "status"}
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE: 其他进程不能在查找和插入之间插入相同 result_key 的任务
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT task_id, status, data, created_at, updated_at, finished_at FROM tasks "
+                    "WHERE result_key = ? AND status != 'failed' ORDER BY created_at DESC",
+                    (result_key,),
+                ).fetchall()
+                for row in rows:
+                    if is_reusable(self._row_to_task(row)):
+                        conn.execute("COMMIT")
+                        return row[0]
+                conn.execute(
+                    "INSERT INTO tasks (task_id, status, result_key, queue_owner, data, created_at, updated_at, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                    (task_id, record["status"], result_key, queue_owner, json.dumps(data, ensure_ascii=False), now, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return None
+
+    def get(self, task_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT task_id, status, data, created_at, updated_at, finished_at FROM tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def transition(self, task_id, from_statuses, to_status, **fields):
+        now = time.time()
+        finished_at = now if to_status in FINISHED_STATUSES else None
+        placeholders = ", ".join("?" for _ in from_statuses)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT data FROM tasks WHERE task_id = ? AND status IN ({placeholders})",
+                    (task_id, *from_statuses),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return False
+                data = {**json.loads(row[0]), **fields}
+                conn.execute(
+                    "UPDATE tasks SET status = ?, data = ?, updated_at = ?, finished_at = COALESCE(?, finished_at) "
+                    "WHERE task_id = ?",
+                    (to_status, json.dumps(data, ensure_ascii=False), now, finished_at, task_id),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def delete(self, task_id):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+
+    def add_event(self, task_id, event):
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO task_events (task_id, data) VALUES (?, ?)",
+                (task_id, json.dumps(event, ensure_ascii=False)),
+            )
+
+    def get_events(self, task_id, after_id=0):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT event_id, data FROM task_events WHERE task_id = ? AND event_id > ? ORDER BY event_id",
+                (task_id, after_id),
+            ).fetchall()
+        return [(event_id, json.loads(data)) for event_id, data in rows]
+
+    def queue_position(self, task_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM tasks AS other JOIN tasks AS task ON task.task_id = ? "
+                "WHERE task.status = 'pending' AND other.status = 'pending' "
+                "AND other.queue_owner = task.queue_owner AND other.created_at <= task.created_at",
+                (task_id,),
+            ).fetchone()
+        return row[0] or None
+
+    def fail_interrupted(self, is_owner_alive):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT task_id, queue_owner FROM tasks WHERE status IN ('pending', 'processing')"
+            ).fetchall()
+        count = 0
+        for task_id, queue_owner in rows:
+            if not is_owner_alive(queue_owner):
+                count += self.transition(task_id, ACTIVE_STATUSES, "failed", error="Task interrupted by a server restart.")
+        return count
+
+    def evict_finished(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT task_id, status, data, created_at, updated_at, finished_at FROM tasks "
+                    "WHERE status IN ('completed', 'failed') AND finished_at < ?",
+                    (cutoff,),
+                ).fetchall()
+                conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(row[0],) for row in rows])
+                conn.executemany("DELETE FROM task_events WHERE task_id = ?", [(row[0],) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [self._row_to_task(row) for row in rows]
+
+
+def create_task_store(kind=TASK_STORE):
+    """
+    按 TASK_STORE 环境变量创建任务存储: "sqlite" (默认) 或 "memory"。
+    """
+    if kind == "sqlite":
+        return SqliteTaskStore()
+    if kind == "memory":
+        return InMemoryTaskStore()
+    raise ValueError(f"Unsupported task store: {kind}")
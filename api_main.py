@@ -1,7 +1,10 @@
 # api_main.py
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from api.routers import pdf_processing
 from api import services as api_services_module 
+from api.metrics import render_metrics
 
 app = FastAPI(
     title="PDF Structure Extractor API - Refactored",
@@ -9,6 +12,27 @@ app = FastAPI(
     version="1.1.0"
 )
 
+UPLOAD_PATH = pdf_processing.router.url_path_for("upload_pdf_for_processing_endpoint")
+
+class RejectUploadIfQueueFull:
+    """
+    任务队列已满时, 在读取请求体之前以 429 拒绝上传, 不接收整个 PDF。
+    (upload 端点运行时 FastAPI 已经解析了 UploadFile, 端点中的检查只能避免保存文件。)
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == UPLOAD_PATH
+                and api_services_module.job_queue.is_full()):
+            error = api_services_module.queue_full_error()
+            response = JSONResponse(status_code=error.status_code, content={"detail": error.detail}, headers=error.headers)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(RejectUploadIfQueueFull)
+
 # 包含 PDF 处理相关的路由
 app.include_router(pdf_processing.router)
 # 如果有其他路由组，也在这里包含进来
@@ -23,6 +47,13 @@ async def read_root():
     """
     return {"status": "API is running", "message": "Welcome to the PDF Processing API!"}
 
+@app.get("/metrics", summary="Prometheus Metrics", tags=["General"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Queue depth, task durations, LLM requests, tokens and cache hits, upload bytes (Prometheus text format).
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # (可选) 应用启动和关闭事件
 @app.on_event("startup")
 async def startup_event():
@@ -32,10 +63,17 @@ async def startup_event():
     api_services_module.RESULTS_DIR.mkdir(parents=True, exist_ok=True)  # <--- 修改处
     print(f"Upload directory: {api_services_module.UPLOAD_DIR}")        # <--- 修改处
     print(f"Results directory: {api_services_module.RESULTS_DIR}")      # <--- 修改处
+    # 启动进度事件和指标队列以及任务队列的 worker 进程
+    await asyncio.to_thread(api_services_module.start)
+    # 定期清理过期任务和结果文件 (启动时先清理一次, 并标记重启前中断的任务)
+    app.state.task_cleanup = asyncio.create_task(api_services_module.run_task_cleanup_loop())
     print("Application startup complete.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    app.state.task_cleanup.cancel()
+    # 停止任务队列和进度事件队列, 等待正在运行的任务结束
+    api_services_module.shutdown()
     print("Application shutdown.")
 
 # 如果需要直接运行 (例如 uvicorn api_main:app --reload)
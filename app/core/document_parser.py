@@ -1,4 +1,5 @@
 import os
+import logging
 import json
 import copy
 import asyncio
@@ -6,8 +7,8 @@ from io import BytesIO
 from pathlib import Path
 from dotenv import load_dotenv
 from app.utils.logging_utils import JsonLogger
-from app.utils.pdf_utils import get_page_tokens, get_pdf_name
-from app.utils.text_utils import count_tokens
+from app.utils.progress_utils import emit_progress, gather_with_progress
+from app.utils.pdf_utils import PdfDocument, get_page_tokens, tag_pages_with_physical_index
 from app.utils.conversion_utils import convert_physical_index_to_int
 
 
@@ -15,23 +16,25 @@ from app.utils.data_structure_utils import post_processing, add_preface_if_neede
 from app.utils.data_structure_utils import write_node_id, add_node_text, remove_structure_text, add_node_text_with_labels
 from app.utils.openai_api import generate_summaries_for_structure, generate_doc_description
 from app.utils.config_utils import ConfigLoader
+from app.utils.llm_client_utils import aclose_async_clients
+from app.utils.retry_utils import retry_budget
+from app.utils.tracing_utils import Tracer, tracing, trace_span
 
 
 from app.core.toc_discovery import check_toc
 from app.core.toc_structuring_llm import toc_transformer, generate_toc_init, generate_toc_continue
-from app.core.toc_indexing import toc_index_extractor, add_page_number_to_toc, extract_matching_page_pairs
+from app.core.toc_indexing import toc_index_extractor, add_page_number_to_toc_concurrent, extract_matching_page_pairs
 from app.core.toc_indexing import calculate_page_offset, add_page_offset_to_toc_json, process_none_page_numbers
 from app.core.toc_validation_llm import verify_toc, fix_incorrect_toc_with_retries
 from app.core.toc_validation_llm import check_title_appearance_in_start_concurrent
-from app.core.toc_utils import page_list_to_group_text, remove_page_number
+from app.core.toc_utils import page_list_to_group_text, remove_page_number, merge_chunk_tocs
+from app.core.title_matching import TitleMatcher
 
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
@@ -63,62 +66,57 @@ def validate_and_truncate_physical_indices(toc_with_page_number, page_list_lengt
     if truncated_items and logger:
         logger.info(f"Total removed items: {len(truncated_items)}")
         
-    print(f"Document validation: {page_list_length} pages, max allowed index: {max_allowed_page}")
+    logging.info(f"Document validation: {page_list_length} pages, max allowed index: {max_allowed_page}")
     if truncated_items:
-        print(f"Truncated {len(truncated_items)} TOC items that exceeded document length")
+        logging.info(f"Truncated {len(truncated_items)} TOC items that exceeded document length")
      
     return toc_with_page_number
 
 
-def process_no_toc(page_list, start_index=1, model=MODEL, logger=None):
-    page_contents=[]
-    token_lengths=[]
-    for page_index in range(start_index, start_index+len(page_list)):
-        page_text = f"<physical_index_{page_index}>\n{page_list[page_index-start_index][0]}\n<physical_index_{page_index}>\n\n"
-        page_contents.append(page_text)
-        token_lengths.append(count_tokens(page_text, model))
+async def process_no_toc(page_list, start_index=1, model=MODEL, logger=None, generation_mode='sequential'):
+    page_contents, token_lengths = tag_pages_with_physical_index(page_list, start_index)
     group_texts = page_list_to_group_text(page_contents, token_lengths)
     logger.info(f'len(group_texts): {len(group_texts)}')
 
-    toc_with_page_number= generate_toc_init(group_texts[0], model)
-    for group_text in group_texts[1:]:
-        toc_with_page_number_additional = generate_toc_continue(toc_with_page_number, group_text, model)    
-        toc_with_page_number.extend(toc_with_page_number_additional)
-    logger.info(f'generate_toc: {toc_with_page_number}')
+    if generation_mode == 'parallel' and len(group_texts) > 1:
+        # Extract every chunk on its own, then stitch and renumber the results
+        chunk_tocs = await gather_with_progress('structure_chunk', [generate_toc_init(group_text, model) for group_text in group_texts])
+        toc_with_page_number = merge_chunk_tocs(chunk_tocs)
+    else:
+        toc_with_page_number= await generate_toc_init(group_texts[0], model)
+        emit_progress('structure_chunk', done=1, total=len(group_texts))
+        for chunk_index, group_text in enumerate(group_texts[1:], start=2):
+            toc_with_page_number_additional = await generate_toc_continue(toc_with_page_number, group_text, model)    
+            toc_with_page_number.extend(toc_with_page_number_additional)
+            emit_progress('structure_chunk', done=chunk_index, total=len(group_texts))
+    logger.debug(lambda: f'generate_toc: {toc_with_page_number}')
 
     toc_with_page_number = convert_physical_index_to_int(toc_with_page_number)
-    logger.info(f'convert_physical_index_to_int: {toc_with_page_number}')
+    logger.debug(lambda: f'convert_physical_index_to_int: {toc_with_page_number}')
 
     return toc_with_page_number
 
 
-def process_toc_no_page_numbers(toc_content, toc_page_list, page_list,  start_index=1, model=MODEL, logger=None):
-    page_contents=[]
-    token_lengths=[]
-    toc_content = toc_transformer(toc_content, model)
-    logger.info(f'toc_transformer: {toc_content}')
-    for page_index in range(start_index, start_index+len(page_list)):
-        page_text = f"<physical_index_{page_index}>\n{page_list[page_index-start_index][0]}\n<physical_index_{page_index}>\n\n"
-        page_contents.append(page_text)
-        token_lengths.append(count_tokens(page_text, model))
+async def process_toc_no_page_numbers(toc_content, toc_page_list, page_list,  start_index=1, model=MODEL, logger=None, concurrency=4):
+    toc_content = await toc_transformer(toc_content, model)
+    logger.debug(lambda: f'toc_transformer: {toc_content}')
+    page_contents, token_lengths = tag_pages_with_physical_index(page_list, start_index)
     
     group_texts = page_list_to_group_text(page_contents, token_lengths)
     logger.info(f'len(group_texts): {len(group_texts)}')
 
-    toc_with_page_number=copy.deepcopy(toc_content)
-    for group_text in group_texts:
-        toc_with_page_number = add_page_number_to_toc(group_text, toc_with_page_number, model)
-    logger.info(f'add_page_number_to_toc: {toc_with_page_number}')
+    toc_with_page_number = await add_page_number_to_toc_concurrent(group_texts, toc_content, model, concurrency=concurrency)
+    logger.debug(lambda: f'add_page_number_to_toc: {toc_with_page_number}')
 
     toc_with_page_number = convert_physical_index_to_int(toc_with_page_number)
-    logger.info(f'convert_physical_index_to_int: {toc_with_page_number}')
+    logger.debug(lambda: f'convert_physical_index_to_int: {toc_with_page_number}')
 
     return toc_with_page_number
 
 
-def process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=None, model=MODEL, logger=None):
-    toc_with_page_number = toc_transformer(toc_content, model)
-    logger.info(f'toc_with_page_number: {toc_with_page_number}')
+async def process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=None, model=MODEL, logger=None, max_tokens=20000):
+    toc_with_page_number = await toc_transformer(toc_content, model)
+    logger.debug(lambda: f'toc_with_page_number: {toc_with_page_number}')
 
     toc_no_page_number = remove_page_number(copy.deepcopy(toc_with_page_number))
     
@@ -127,77 +125,92 @@ def process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_che
     for page_index in range(start_page_index, min(start_page_index + toc_check_page_num, len(page_list))):
         main_content += f"<physical_index_{page_index+1}>\n{page_list[page_index][0]}\n<physical_index_{page_index+1}>\n\n"
 
-    toc_with_physical_index = toc_index_extractor(toc_no_page_number, main_content, model)
-    logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
+    toc_with_physical_index = await toc_index_extractor(toc_no_page_number, main_content, model)
+    logger.debug(lambda: f'toc_with_physical_index: {toc_with_physical_index}')
 
     toc_with_physical_index = convert_physical_index_to_int(toc_with_physical_index)
-    logger.info(f'toc_with_physical_index: {toc_with_physical_index}')
+    logger.debug(lambda: f'toc_with_physical_index: {toc_with_physical_index}')
 
     matching_pairs = extract_matching_page_pairs(toc_with_page_number, toc_with_physical_index, start_page_index)
-    logger.info(f'matching_pairs: {matching_pairs}')
+    logger.debug(lambda: f'matching_pairs: {matching_pairs}')
 
     offset = calculate_page_offset(matching_pairs)
     logger.info(f'offset: {offset}')
 
     toc_with_page_number = add_page_offset_to_toc_json(toc_with_page_number, offset)
-    logger.info(f'toc_with_page_number: {toc_with_page_number}')
+    logger.debug(lambda: f'toc_with_page_number: {toc_with_page_number}')
 
-    toc_with_page_number = process_none_page_numbers(toc_with_page_number, page_list, model=model)
-    logger.info(f'toc_with_page_number: {toc_with_page_number}')
+    toc_with_page_number = await process_none_page_numbers(toc_with_page_number, page_list, model=model, max_tokens=max_tokens)
+    logger.debug(lambda: f'toc_with_page_number: {toc_with_page_number}')
 
     return toc_with_page_number
 
 
-async def meta_processor(page_list, mode=None, toc_content=None, toc_page_list=None, start_index=1, opt=None, logger=None):
-    print(mode)
-    print(f'start_index: {start_index}')
-    
-    if mode == 'process_toc_with_page_numbers':
-        toc_with_page_number = process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=opt.toc_check_page_num, model=opt.model, logger=logger)
-    elif mode == 'process_toc_no_page_numbers':
-        toc_with_page_number = process_toc_no_page_numbers(toc_content, toc_page_list, page_list, model=opt.model, logger=logger)
-    else:
-        toc_with_page_number = process_no_toc(page_list, start_index=start_index, model=opt.model, logger=logger)
-            
-    toc_with_page_number = [item for item in toc_with_page_number if item.get('physical_index') is not None] 
-    
-    toc_with_page_number = validate_and_truncate_physical_indices(
-        toc_with_page_number, 
-        len(page_list), 
-        start_index=start_index, 
-        logger=logger
-    )
-    
-    accuracy, incorrect_results = await verify_toc(page_list, toc_with_page_number, start_index=start_index, model=opt.model)
+async def meta_processor(page_list, mode=None, toc_content=None, toc_page_list=None, start_index=1, opt=None, logger=None, matcher=None):
+    logging.info(f'mode: {mode}')
+    logging.info(f'start_index: {start_index}')
+    emit_progress('structure_generation', mode=mode, start_index=start_index, pages=len(page_list))
+
+    with trace_span(f'meta_processor[{mode}]', mode=mode, start_index=start_index, pages=len(page_list)) as span:
+        with trace_span(mode):
+            if mode == 'process_toc_with_page_numbers':
+                toc_with_page_number = await process_toc_with_page_numbers(toc_content, toc_page_list, page_list, toc_check_page_num=opt.toc_check_page_num, model=opt.model, logger=logger, max_tokens=opt.max_token_num_each_node)
+            elif mode == 'process_toc_no_page_numbers':
+                toc_with_page_number = await process_toc_no_page_numbers(toc_content, toc_page_list, page_list, model=opt.model, logger=logger, concurrency=opt.add_page_number_concurrency)
+            else:
+                toc_with_page_number = await process_no_toc(page_list, start_index=start_index, model=opt.model, logger=logger, generation_mode=opt.toc_generation_mode)
+                
+        toc_with_page_number = [item for item in toc_with_page_number if item.get('physical_index') is not None] 
         
-    logger.info({
-        'mode': 'process_toc_with_page_numbers',
-        'accuracy': accuracy,
-        'incorrect_results': incorrect_results
-    })
-    if accuracy == 1.0 and len(incorrect_results) == 0:
-        return toc_with_page_number
-    if accuracy > 0.6 and len(incorrect_results) > 0:
-        toc_with_page_number, incorrect_results = await fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results,start_index=start_index, max_attempts=3, model=opt.model, logger=logger)
-        return toc_with_page_number
-    else:
+        toc_with_page_number = validate_and_truncate_physical_indices(
+            toc_with_page_number, 
+            len(page_list), 
+            start_index=start_index, 
+            logger=logger
+        )
+        
+        with trace_span('verify_toc', items=len(toc_with_page_number)):
+            accuracy, incorrect_results = await verify_toc(page_list, toc_with_page_number, start_index=start_index, model=opt.model,
+                                                           sample_size=opt.verify_sample_size, confidence=opt.verify_confidence,
+                                                           max_rounds=opt.verify_max_rounds, logger=logger, matcher=matcher)
+            
+        logger.info({
+            'mode': mode,
+            'accuracy': accuracy,
+            'incorrect_results': incorrect_results
+        })
+        emit_progress('verification', mode=mode, accuracy=accuracy, items=len(toc_with_page_number), incorrect=len(incorrect_results))
+        span.update(items=len(toc_with_page_number), accuracy=accuracy, incorrect=len(incorrect_results))
+        if accuracy == 1.0 and len(incorrect_results) == 0:
+            return toc_with_page_number
+        if accuracy > 0.6 and len(incorrect_results) > 0:
+            with trace_span('fix_incorrect_toc_with_retries', items=len(incorrect_results)):
+                toc_with_page_number, incorrect_results = await fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results,start_index=start_index, max_attempts=3, model=opt.model, logger=logger, matcher=matcher)
+            return toc_with_page_number
         if mode == 'process_toc_with_page_numbers':
-            return await meta_processor(page_list, mode='process_toc_no_page_numbers', toc_content=toc_content, toc_page_list=toc_page_list, start_index=start_index, opt=opt, logger=logger)
+            fallback_mode = 'process_toc_no_page_numbers'
         elif mode == 'process_toc_no_page_numbers':
-            return await meta_processor(page_list, mode='process_no_toc', start_index=start_index, opt=opt, logger=logger)
+            fallback_mode = 'process_no_toc'
         else:
             raise Exception('Processing failed')
+        span['fallback_to'] = fallback_mode
+
+    # The fallback gets its own span instead of being counted in the span of the rejected mode
+    return await meta_processor(page_list, mode=fallback_mode, toc_content=toc_content, toc_page_list=toc_page_list, start_index=start_index, opt=opt, logger=logger, matcher=matcher)
         
 
-async def process_large_node_recursively(node, page_list, opt=None, logger=None):
+async def process_large_node_recursively(node, page_list, opt=None, logger=None, matcher=None):
     node_page_list = page_list[node['start_index']-1:node['end_index']]
     token_num = sum([page[1] for page in node_page_list])
     
     if node['end_index'] - node['start_index'] > opt.max_page_num_each_node and token_num >= opt.max_token_num_each_node:
-        print('large node:', node['title'], 'start_index:', node['start_index'], 'end_index:', node['end_index'], 'token_num:', token_num)
+        logging.info(f"large node: {node['title']} start_index: {node['start_index']} end_index: {node['end_index']} token_num: {token_num}")
+        emit_progress('large_node', title=node['title'], start_index=node['start_index'], end_index=node['end_index'], tokens=token_num)
 
-        node_toc_tree = await meta_processor(node_page_list, mode='process_no_toc', start_index=node['start_index'], opt=opt, logger=logger)
-        node_toc_tree = await check_title_appearance_in_start_concurrent(node_toc_tree, page_list, model=opt.model, logger=logger)
+        with trace_span('process_large_node_recursively', start_index=node['start_index'], end_index=node['end_index'], tokens=token_num):
+            node_toc_tree = await meta_processor(node_page_list, mode='process_no_toc', start_index=node['start_index'], opt=opt, logger=logger, matcher=matcher)
+            with trace_span('check_title_appearance_in_start', items=len(node_toc_tree)):
+                node_toc_tree = await check_title_appearance_in_start_concurrent(node_toc_tree, page_list, model=opt.model, logger=logger, matcher=matcher)
         
         # Filter out items with None physical_index before post_processing
         valid_node_toc_items = [item for item in node_toc_tree if item.get('physical_index') is not None]
@@ -211,7 +224,7 @@ async def process_large_node_recursively(node, page_list, opt=None, logger=None)
         
     if 'nodes' in node and node['nodes']:
         tasks = [
-            process_large_node_recursively(child_node, page_list, opt, logger=logger)
+            process_large_node_recursively(child_node, page_list, opt, logger=logger, matcher=matcher)
             for child_node in node['nodes']
         ]
         await asyncio.gather(*tasks)
@@ -220,8 +233,14 @@ async def process_large_node_recursively(node, page_list, opt=None, logger=None)
 
 
 async def tree_parser(page_list, opt, doc=None, logger=None):
-    check_toc_result = check_toc(page_list, opt)
-    logger.info(check_toc_result)
+    matcher = TitleMatcher.from_opt(opt)
+    with trace_span('check_toc'):
+        check_toc_result = await check_toc(page_list, opt)
+    logger.debug(lambda: check_toc_result)
+    emit_progress('toc_detection',
+                  toc_found=bool(check_toc_result.get("toc_content") and check_toc_result["toc_content"].strip()),
+                  toc_pages=len(check_toc_result.get('toc_page_list') or []),
+                  page_index_given_in_toc=check_toc_result.get("page_index_given_in_toc"))
 
     if check_toc_result.get("toc_content") and check_toc_result["toc_content"].strip() and check_toc_result["page_index_given_in_toc"] == "yes":
         toc_with_page_number = await meta_processor(
@@ -231,34 +250,59 @@ async def tree_parser(page_list, opt, doc=None, logger=None):
             toc_content=check_toc_result['toc_content'], 
             toc_page_list=check_toc_result['toc_page_list'], 
             opt=opt,
-            logger=logger)
+            logger=logger,
+            matcher=matcher)
     else:
         toc_with_page_number = await meta_processor(
             page_list, 
             mode='process_no_toc', 
             start_index=1, 
             opt=opt,
-            logger=logger)
+            logger=logger,
+            matcher=matcher)
 
     toc_with_page_number = add_preface_if_needed(toc_with_page_number)
-    toc_with_page_number = await check_title_appearance_in_start_concurrent(toc_with_page_number, page_list, model=opt.model, logger=logger)
+    with trace_span('check_title_appearance_in_start', items=len(toc_with_page_number)):
+        toc_with_page_number = await check_title_appearance_in_start_concurrent(toc_with_page_number, page_list, model=opt.model, logger=logger, matcher=matcher)
     
     # Filter out items with None physical_index before post_processings
     valid_toc_items = [item for item in toc_with_page_number if item.get('physical_index') is not None]
     
     toc_tree = post_processing(valid_toc_items, len(page_list))
     tasks = [
-        process_large_node_recursively(node, page_list, opt, logger=logger)
+        process_large_node_recursively(node, page_list, opt, logger=logger, matcher=matcher)
         for node in toc_tree
     ]
-    await asyncio.gather(*tasks)
+    await gather_with_progress('large_node_recursion', tasks)
+
+    if matcher is not None:
+        logger.info({'title_matching': matcher.summary()})
     
     return toc_tree
 
 
-def page_index_main(doc, opt=None):
-    logger = JsonLogger(doc)
-    
+def _run_async(coro):
+    """
+    asyncio.run that closes the LLM clients of its event loop before the loop ends, so their connections are not leaked.
+    """
+    async def run():
+        try:
+            return await coro
+        finally:
+            await aclose_async_clients()
+    return asyncio.run(run())
+
+
+def page_index_main(doc, opt=None, tracer=None):
+    """
+    Build the tree structure of a PDF.
+    Args:
+        doc (str or BytesIO): The PDF file path or content.
+        opt (SimpleNamespace): The options loaded by ConfigLoader.
+        tracer (Tracer): Optional tracer receiving the stage and LLM call spans, e.g. to export them afterwards.
+    Returns:
+        dict: doc_name, structure, and doc_description / trace when requested by the options.
+    """
     is_valid_pdf = (
         (isinstance(doc, str) and os.path.isfile(doc) and doc.lower().endswith(".pdf")) or 
         isinstance(doc, BytesIO)
@@ -266,38 +310,63 @@ def page_index_main(doc, opt=None):
     if not is_valid_pdf:
         raise ValueError("Unsupported input type. Expected a PDF file path or BytesIO object.")
 
-    print('Parsing PDF...')
-    page_list = get_page_tokens(doc)
-
-    logger.info({'total_page_number': len(page_list)})
-    logger.info({'total_token': sum([page[1] for page in page_list])})
-    
-    structure = asyncio.run(tree_parser(page_list, opt, doc=doc, logger=logger))
-    if opt.if_add_node_id == 'yes':
-        write_node_id(structure)    
-    if opt.if_add_node_text == 'yes':
-        add_node_text(structure, page_list)
-    if opt.if_add_node_summary == 'yes':
-        if opt.if_add_node_text == 'no':
-            add_node_text(structure, page_list)
-        asyncio.run(generate_summaries_for_structure(structure, model=opt.model))
-        if opt.if_add_node_text == 'no':
-            remove_structure_text(structure)
-        if opt.if_add_doc_description == 'yes':
-            doc_description = generate_doc_description(structure, model=opt.model)
-            return {
-                'doc_name': get_pdf_name(doc),
-                'doc_description': doc_description,
-                'structure': structure,
-            }
-    return {
-        'doc_name': get_pdf_name(doc),
-        'structure': structure,
-    }
+    tracer = tracer or Tracer()
+    with tracing(tracer), trace_span('page_index') as root_span:
+        logger = None
+        try:
+            # Open the PDF once, the name, the page text and the token counts all come from this handle
+            with PdfDocument(doc, pdf_parser=opt.pdf_parser) as pdf:
+                doc_name = pdf.name
+                logger = JsonLogger(pdf, level=opt.log_level, console=opt.log_console)
+                logging.info('Parsing PDF...')
+                with trace_span('get_page_tokens', pages=pdf.page_count):
+                    page_list = get_page_tokens(pdf, workers=opt.pdf_extract_workers, min_pages=opt.pdf_parallel_min_pages)
+            root_span.update(doc_name=doc_name, pages=len(page_list))
+
+            with retry_budget():
+                logger.info({'total_page_number': len(page_list)})
+                logger.info({'total_token': sum([page[1] for page in page_list])})
+                emit_progress('pdf_parsed', pages=len(page_list), tokens=sum([page[1] for page in page_list]))
+        
+                structure = _run_async(tree_parser(page_list, opt, doc=doc, logger=logger))
+                if opt.if_add_node_id == 'yes':
+                    write_node_id(structure)    
+                if opt.if_add_node_text == 'yes':
+                    add_node_text(structure, page_list)
+                result = {
+                    'doc_name': doc_name,
+                    'structure': structure,
+                }
+                if opt.if_add_node_summary == 'yes':
+                    if opt.if_add_node_text == 'no':
+                        add_node_text(structure, page_list)
+                    with trace_span('summaries'):
+                        _run_async(generate_summaries_for_structure(structure, model=opt.model))
+                    if opt.if_add_node_text == 'no':
+                        remove_structure_text(structure)
+                    if opt.if_add_doc_description == 'yes':
+                        with trace_span('doc_description'):
+                            doc_description = generate_doc_description(structure, model=opt.model)
+                        result = {
+                            'doc_name': doc_name,
+                            'doc_description': doc_description,
+                            'structure': structure,
+                        }
+        finally:
+            # Write the buffered log entries and stop the log writer thread, also when the PDF could not be read
+            if logger is not None:
+                logger.close()
+
+    trace_report = tracer.report()
+    logging.info(f"Processed in {trace_report['duration_seconds']}s with {trace_report['llm']['calls']} LLM calls")
+    if opt.if_add_trace_report == 'yes':
+        result['trace'] = trace_report
+    return result
 
 
 def page_index(doc, model=None, toc_check_page_num=None, max_page_num_each_node=None, max_token_num_each_node=None,
-               if_add_node_id=None, if_add_node_summary=None, if_add_doc_description=None, if_add_node_text=None):
+               if_add_node_id=None, if_add_node_summary=None, if_add_doc_description=None, if_add_node_text=None,
+               if_add_trace_report=None):
     
     user_opt = {
         arg: value for arg, value in locals().items()
@@ -0,0 +1,181 @@
+import re
+import random
+import unicodedata
+from difflib import SequenceMatcher
+
+# Leading numbering of a normalized title: "1 2 scope", "chapter 3 methods", "appendix a tables"
+LEADING_NUMBERING_PATTERN = re.compile(r'^((chapter|part|section|appendix)\s+\w+\s+|(\d+\s)+)')
+# Words that say nothing about which section a title belongs to, left out of the token coverage
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'into', 'is', 'it', 'its', 'of', 'on',
+    'or', 'our', 'that', 'the', 'their', 'this', 'to', 'we', 'with', 'vs', 'via',
+))
+
+
+def normalize_title_text(text):
+    """
+    Normalize text for title matching: unicode compatibility forms, lower case, punctuation replaced by spaces
+    and whitespace collapsed.
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = re.sub(r'[^\w\s]|_', ' ', text)
+    return ' '.join(text.split())
+
+
+def normalize_page_lines(page_text):
+    """The non-empty normalized lines of a page."""
+    lines = (normalize_title_text(line) for line in (page_text or '').splitlines())
+    return [line for line in lines if line]
+
+
+class TitleMatcher:
+    """
+    Deterministic matcher deciding whether a section title appears on / starts a page.
+    It only answers "yes" when a line of the page reads as the title itself (a heading), and "no" when the page
+    barely shares any word with the title; every other case is left to the LLM (None).
+    With shadow_rate > 0 a share of the local decisions is also sent to the LLM to measure the agreement rate.
+    """
+
+    def __init__(self, accept=0.9, reject=0.3, start_chars=200, min_chars=4, shadow_rate=0.0):
+        self.accept = accept
+        self.reject = reject
+        self.start_chars = start_chars
+        self.min_chars = min_chars
+        self.shadow_rate = shadow_rate
+        self.stats = {'local_yes': 0, 'local_no': 0, 'sent_to_llm': 0, 'shadow_checks': 0, 'shadow_agreements': 0}
+
+    @classmethod
+    def from_opt(cls, opt):
+        """Build the matcher from the document options, or return None when local matching is disabled."""
+        if opt.title_match_local != 'yes':
+            return None
+        return cls(accept=opt.title_match_accept, reject=opt.title_match_reject,
+                   start_chars=opt.title_match_start_chars, shadow_rate=opt.title_match_shadow_rate)
+
+    def _title_variants(self, title):
+        """
+        Returns:
+            tuple: The normalized title and the title without its numbering (None when it has none),
+                   both None when the title is too short to be matched locally.
+        """
+        normalized = normalize_title_text(title)
+        stripped = LEADING_NUMBERING_PATTERN.sub('', normalized)
+        if len(stripped.replace(' ', '')) < self.min_chars:
+            return None, None
+        return normalized, (stripped if stripped != normalized else None)
+
+    def _is_heading_line(self, line, variant):
+        return line == variant or SequenceMatcher(None, line, variant).ratio() >= self.accept
+
+    def _heading_lines(self, page_text):
+        """
+        Candidate heading lines: every line and every pair of consecutive lines (a title wrapped over two lines),
+        with the offset of the line in the page.
+        """
+        lines = normalize_page_lines(page_text)
+        offsets = []
+        offset = 0
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        candidates = list(zip(lines, offsets))
+        candidates += [(f'{lines[k]} {lines[k + 1]}', offsets[k]) for k in range(len(lines) - 1)]
+        return candidates
+
+    def _find_heading(self, title, page_text):
+        """
+        Returns:
+            int: The offset of the first line reading as the title, None when there is none.
+                 A numbered title found without its numbering only counts within the first start_chars characters.
+        """
+        normalized, stripped = self._title_variants(title)
+        if normalized is None:
+            return None
+        offsets = []
+        for line, offset in self._heading_lines(page_text):
+            if self._is_heading_line(line, normalized):
+                offsets.append(offset)
+            elif stripped is not None and offset <= self.start_chars and self._is_heading_line(line, stripped):
+                offsets.append(offset)
+        return min(offsets) if offsets else None
+
+    def _token_coverage(self, title, page_text):
+        tokens = LEADING_NUMBERING_PATTERN.sub('', normalize_title_text(title)).split()
+        title_tokens = {token for token in tokens if token not in STOPWORDS} or set(tokens)
+        if not title_tokens:
+            return None
+        page_tokens = set(normalize_title_text(page_text).split())
+        return len(title_tokens & page_tokens) / len(title_tokens)
+
+    def _appears_as_words(self, title, page_text):
+        normalized, stripped = self._title_variants(title)
+        page = f' {normalize_title_text(page_text)} '
+        return any(f' {variant} ' in page for variant in (normalized, stripped) if variant)
+
+    def _count(self, answer):
+        if answer == 'yes':
+            self.stats['local_yes'] += 1
+        elif answer == 'no':
+            self.stats['local_no'] += 1
+        else:
+            self.stats['sent_to_llm'] += 1
+        return answer
+
+    def _match_in_page(self, title, page_text):
+        if self._title_variants(title)[0] is None:
+            return None
+        if self._find_heading(title, page_text) is not None:
+            return 'yes'
+        if self._appears_as_words(title, page_text):
+            return None
+        coverage = self._token_coverage(title, page_text)
+        if coverage is not None and coverage <= self.reject:
+            return 'no'
+        return None
+
+    def match_in_page(self, title, page_text):
+        """
+        Decide whether the section title appears in the page.
+        Returns:
+            str: "yes" when a line of the page is the title, "no" when the page shares almost no word with it,
+                 None when the LLM should decide.
+        """
+        return self._count(self._match_in_page(title, page_text))
+
+    def match_at_start(self, title, page_text):
+        """
+        Decide whether the section starts at the beginning of the page, i.e. nothing but a page number comes before the title.
+        Returns:
+            str: "yes" or "no" when the answer is clear, None when the LLM should decide.
+        """
+        if self._title_variants(title)[0] is None:
+            return self._count(None)
+        position = self._find_heading(title, page_text)
+        if position is None:
+            # A section that does not appear on the page cannot start it
+            return self._count('no' if self._match_in_page(title, page_text) == 'no' else None)
+        prefix = ' '.join(normalize_page_lines(page_text))[:position].replace(' ', '')
+        if prefix == '' or prefix.isdigit():
+            return self._count('yes')
+        if position > self.start_chars:
+            return self._count('no')
+        return self._count(None)
+
+    def should_shadow(self):
+        """Whether a local decision should also be sent to the LLM to measure agreement."""
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_shadow(self, local_answer, llm_answer):
+        self.stats['shadow_checks'] += 1
+        if local_answer == llm_answer:
+            self.stats['shadow_agreements'] += 1
+
+    def summary(self):
+        local = self.stats['local_yes'] + self.stats['local_no']
+        total = local + self.stats['sent_to_llm']
+        shadow_checks = self.stats['shadow_checks']
+        return {
+            **self.stats,
+            'local_rate': local / total if total else 0.0,
+            'agreement_rate': self.stats['shadow_agreements'] / shadow_checks if shadow_checks else None,
+        }
@@ -1,23 +1,24 @@
 import re
+import logging
 import os
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
-from app.utils.openai_api import ChatGPT_API, ChatGPT_API_with_finish_reason
+from app.utils.openai_api import ChatGPT_API_async, ChatGPT_API_with_finish_reason_async
 from app.utils.json_utils import extract_json
 from app.core.toc_validation_llm import check_if_toc_transformation_is_complete
+from app.core.toc_heuristics import classify_toc_page
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
-def toc_detector_single_page(content, model=MODEL):
+async def toc_detector_single_page(content, model=MODEL):
     """
     Function to detect if a table of contents is present in the given content.
     Args:
@@ -40,13 +41,13 @@ def toc_detector_single_page(content, model=MODEL):
     Directly return the final JSON structure. Do not output anything else.
     Please note: abstract,summary, notation list, figure list, table list, etc. are not table of contents."""
 
-    response = ChatGPT_API(model=model, prompt=prompt,base_url=BASE_URL, api_key=API_KEY)
+    response = await ChatGPT_API_async(model=model, prompt=prompt,base_url=BASE_URL, api_key=API_KEY)
     # print('response', response)
     json_content = extract_json(response)    
     return json_content['toc_detected']
 
 
-def extract_toc_content(content, model=MODEL):
+async def extract_toc_content(content, model=MODEL):
     prompt = f"""
     Your job is to extract the full table of contents from the given text, replace ... with :
 
@@ -54,10 +55,10 @@ def extract_toc_content(content, model=MODEL):
 
     Directly return the full table of contents content. Do not output anything else."""
 
-    response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, 
+    response, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, 
                                                              base_url=BASE_URL, api_key=API_KEY)
     
-    if_complete = check_if_toc_transformation_is_complete(content, response, model)
+    if_complete = await check_if_toc_transformation_is_complete(content, response, model)
     if if_complete == "yes" and finish_reason == "finished":
         return response
     
@@ -66,11 +67,11 @@ def extract_toc_content(content, model=MODEL):
         {"role": "assistant", "content": response},    
     ]
     prompt = f"""please continue the generation of table of contents , directly output the remaining part of the structure"""
-    new_response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, 
+    new_response, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, 
                                                                  chat_history=chat_history, 
                                                                  base_url=BASE_URL, api_key=API_KEY)
     response = response + new_response
-    if_complete = check_if_toc_transformation_is_complete(content, response, model)
+    if_complete = await check_if_toc_transformation_is_complete(content, response, model)
     
     while not (if_complete == "yes" and finish_reason == "finished"):
         chat_history = [
@@ -78,11 +79,11 @@ def extract_toc_content(content, model=MODEL):
             {"role": "assistant", "content": response},    
         ]
         prompt = f"""please continue the generation of table of contents , directly output the remaining part of the structure"""
-        new_response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, 
+        new_response, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, 
                                                                      chat_history=chat_history, 
                                                                      base_url=BASE_URL, api_key=API_KEY)
         response = response + new_response
-        if_complete = check_if_toc_transformation_is_complete(content, response, model)
+        if_complete = await check_if_toc_transformation_is_complete(content, response, model)
         
         # Optional: Add a maximum retry limit to prevent infinite loops
         if len(chat_history) > 5:  # Arbitrary limit of 10 attempts
@@ -91,8 +92,8 @@ def extract_toc_content(content, model=MODEL):
     return response
 
 
-def detect_page_index(toc_content, model=MODEL):
-    print('start detect_page_index')
+async def detect_page_index(toc_content, model=MODEL):
+    logging.info('start detect_page_index')
     prompt = f"""
     You will be given a table of contents.
 
@@ -107,13 +108,13 @@ def detect_page_index(toc_content, model=MODEL):
     }}
     Directly return the final JSON structure. Do not output anything else."""
 
-    response = ChatGPT_API(model=model, prompt=prompt, 
+    response = await ChatGPT_API_async(model=model, prompt=prompt, 
                            base_url=BASE_URL, api_key=API_KEY)
     json_content = extract_json(response)
     return json_content['page_index_given_in_toc']
 
 
-def toc_extractor(page_list, toc_page_list, model=MODEL):
+async def toc_extractor(page_list, toc_page_list, model=MODEL):
     def transform_dots_to_colon(text):
         text = re.sub(r'\.{5,}', ': ', text)
         # Handle dots separated by spaces
@@ -124,7 +125,7 @@ def toc_extractor(page_list, toc_page_list, model=MODEL):
     for page_index in toc_page_list:
         toc_content += page_list[page_index][0]
     toc_content = transform_dots_to_colon(toc_content)
-    has_page_index = detect_page_index(toc_content, model=model)
+    has_page_index = await detect_page_index(toc_content, model=model)
     
     return {
         "toc_content": toc_content,
@@ -132,8 +133,15 @@ def toc_extractor(page_list, toc_page_list, model=MODEL):
     }
 
 
-def find_toc_pages(start_page_index, page_list, opt, logger=None):
-    print('start find_toc_pages')
+async def find_toc_pages(start_page_index, page_list, opt, logger=None):
+    """
+    Find the run of TOC pages starting from start_page_index.
+    Pages are classified in windows of opt.toc_detect_window pages at a time, then the results are
+    scanned in order: the first "yes" starts the run and the first "no" after it ends the run.
+    With opt.toc_heuristic_filter, pages that are clearly (not) TOC pages are decided without an LLM call.
+    """
+    logging.info('start find_toc_pages')
+    window = max(1, opt.toc_detect_window)
     last_page_is_yes = False
     toc_page_list = []
     i = start_page_index
@@ -142,17 +150,40 @@ def find_toc_pages(start_page_index, page_list, opt, logger=None):
         # Only check beyond max_pages if we're still finding TOC pages
         if i >= opt.toc_check_page_num and not last_page_is_yes:
             break
-        detected_result = toc_detector_single_page(page_list[i][0],model=opt.model)
-        if detected_result == 'yes':
-            if logger:
-                logger.info(f'Page {i} has toc')
-            toc_page_list.append(i)
-            last_page_is_yes = True
-        elif detected_result == 'no' and last_page_is_yes:
-            if logger:
-                logger.info(f'Found the last page with toc: {i-1}')
-            break
-        i += 1
+        window_end = min(i + window, len(page_list))
+        if not last_page_is_yes:
+            window_end = min(window_end, max(opt.toc_check_page_num, i + 1))
+
+        # Settle clear-cut pages locally and only send the ambiguous ones to the LLM
+        window_pages = list(range(i, window_end))
+        if opt.toc_heuristic_filter == 'yes':
+            detected_results = [
+                classify_toc_page(page_list[page_index][0], low=opt.toc_heuristic_low, high=opt.toc_heuristic_high)
+                for page_index in window_pages
+            ]
+        else:
+            detected_results = [None] * len(window_pages)
+        ambiguous = [k for k, result in enumerate(detected_results) if result is None]
+        llm_results = await asyncio.gather(*[
+            toc_detector_single_page(page_list[window_pages[k]][0], model=opt.model)
+            for k in ambiguous
+        ])
+        for k, result in zip(ambiguous, llm_results):
+            detected_results[k] = result
+        if logger:
+            logger.info(f'Pages {i}-{window_end-1}: {len(window_pages) - len(ambiguous)} decided locally, {len(ambiguous)} sent to LLM')
+
+        for page_index, detected_result in zip(window_pages, detected_results):
+            if detected_result == 'yes':
+                if logger:
+                    logger.info(f'Page {page_index} has toc')
+                toc_page_list.append(page_index)
+                last_page_is_yes = True
+            elif detected_result == 'no' and last_page_is_yes:
+                if logger:
+                    logger.info(f'Found the last page with toc: {page_index-1}')
+                return toc_page_list
+        i = window_end
     
     if not toc_page_list and logger:
         logger.info('No toc found')
@@ -160,17 +191,17 @@ def find_toc_pages(start_page_index, page_list, opt, logger=None):
     return toc_page_list
 
 
-def check_toc(page_list, opt=None):
-    toc_page_list = find_toc_pages(start_page_index=0, page_list=page_list, opt=opt)
+async def check_toc(page_list, opt=None):
+    toc_page_list = await find_toc_pages(start_page_index=0, page_list=page_list, opt=opt)
     if len(toc_page_list) == 0:
-        print('no toc found')
+        logging.info('no toc found')
         return {'toc_content': None, 'toc_page_list': [], 'page_index_given_in_toc': 'no'}
     else:
-        print('toc found')
-        toc_json = toc_extractor(page_list, toc_page_list, opt.model)
+        logging.info('toc found')
+        toc_json = await toc_extractor(page_list, toc_page_list, opt.model)
 
         if toc_json['page_index_given_in_toc'] == 'yes':
-            print('index found')
+            logging.info('index found')
             return {'toc_content': toc_json['toc_content'], 'toc_page_list': toc_page_list, 'page_index_given_in_toc': 'yes'}
         else:
             current_start_index = toc_page_list[-1] + 1
@@ -179,7 +210,7 @@ def check_toc(page_list, opt=None):
                    current_start_index < len(page_list) and 
                    current_start_index < opt.toc_check_page_num):
                 
-                additional_toc_pages = find_toc_pages(
+                additional_toc_pages = await find_toc_pages(
                     start_page_index=current_start_index,
                     page_list=page_list,
                     opt=opt
@@ -188,12 +219,12 @@ def check_toc(page_list, opt=None):
                 if len(additional_toc_pages) == 0:
                     break
 
-                additional_toc_json = toc_extractor(page_list, additional_toc_pages, opt.model)
+                additional_toc_json = await toc_extractor(page_list, additional_toc_pages, opt.model)
                 if additional_toc_json['page_index_given_in_toc'] == 'yes':
-                    print('index found')
+                    logging.info('index found')
                     return {'toc_content': additional_toc_json['toc_content'], 'toc_page_list': additional_toc_pages, 'page_index_given_in_toc': 'yes'}
 
                 else:
                     current_start_index = additional_toc_pages[-1] + 1
-            print('index not found')
+            logging.info('index not found')
             return {'toc_content': toc_json['toc_content'], 'toc_page_list': toc_page_list, 'page_index_given_in_toc': 'no'}
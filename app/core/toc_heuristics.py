@@ -0,0 +1,113 @@
+import re
+
+# Lines that carry dot leaders, e.g. "1.2 Scope ........ 7" or "Scope . . . . . 7"
+DOT_LEADER_PATTERN = re.compile(r'(\.{3,}|…{2,}|·{3,}|(?:\. ){3,}|(?:_ ){3,}|_{4,})')
+# Lines ending with an arabic or roman page number, or consisting only of one.
+# A roman page number (up to lxxxix) has to be a well-formed numeral standing on its own, so words such as
+# "mid", "dim" or "civil" are not taken for one.
+NUMBER_END_PATTERN = re.compile(r'(\d{1,4}|(?<!\S)(?=[ivxl])(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))\s*$', re.IGNORECASE)
+# Lines starting like a numbered heading: "3", "2.1.4", "Chapter 5", "Part II", "第三章"
+NUMBERED_START_PATTERN = re.compile(r'^(\d+(\.\d+)*\.?\s|chapter\s|part\s|section\s|appendix\s|第.{1,4}[章节部篇])', re.IGNORECASE)
+# Lines that read like an entry of a list of headings: a few words, starting with a capital or a digit,
+# not ending like a sentence. TOCs without page numbers are made of these.
+HEADING_LINE_PATTERN = re.compile(r'^[A-Z0-9][^!;:,]{0,60}(?<![.;:,])$')
+HEADING_LINE_MAX_WORDS = 8
+TOC_KEYWORD_PATTERN = re.compile(r'(table\s+of\s+contents|\bcontents\b|目\s*录|目\s*次|inhaltsverzeichnis|sommaire|índice|indice)', re.IGNORECASE)
+# Lists that look like a TOC but are not one, the LLM is told to answer "no" for these
+NON_TOC_KEYWORD_PATTERN = re.compile(r'(list\s+of\s+(figures|tables|illustrations|abbreviations)|图\s*目\s*录|表\s*目\s*录|插图目录)', re.IGNORECASE)
+
+
+def toc_page_features(text):
+    """
+    Compute the local signals used to pre-screen a page for a table of contents.
+    Args:
+        text (str): The text of the page.
+    Returns:
+        dict: The line count and the ratio of lines with dot leaders, ending in a number, starting like a numbered heading
+              and reading like a heading, plus whether TOC or non-TOC list keywords are present.
+    """
+    lines = [line.strip() for line in (text or '').splitlines() if line.strip()]
+    line_count = len(lines)
+    if line_count == 0:
+        return {
+            'line_count': 0,
+            'dot_leader_ratio': 0.0,
+            'number_end_ratio': 0.0,
+            'numbered_start_ratio': 0.0,
+            'heading_line_ratio': 0.0,
+            'has_toc_keyword': False,
+            'has_non_toc_keyword': False,
+        }
+    return {
+        'line_count': line_count,
+        'dot_leader_ratio': sum(1 for line in lines if DOT_LEADER_PATTERN.search(line)) / line_count,
+        'number_end_ratio': sum(1 for line in lines if NUMBER_END_PATTERN.search(line)) / line_count,
+        'numbered_start_ratio': sum(1 for line in lines if NUMBERED_START_PATTERN.search(line)) / line_count,
+        'heading_line_ratio': sum(1 for line in lines
+                                  if len(line.split()) <= HEADING_LINE_MAX_WORDS and HEADING_LINE_PATTERN.search(line)) / line_count,
+        'has_toc_keyword': bool(TOC_KEYWORD_PATTERN.search(text)),
+        'has_non_toc_keyword': bool(NON_TOC_KEYWORD_PATTERN.search(text)),
+    }
+
+
+def _score_features(features):
+    if features['line_count'] < 3:
+        return 0.0
+    # Numbered headings or a list of short heading lines are what is left of a TOC without page numbers
+    list_structure = max(min(1.0, features['numbered_start_ratio'] / 0.3),
+                         min(1.0, features['heading_line_ratio'] / 0.6))
+    score = (
+        0.4 * min(1.0, features['dot_leader_ratio'] / 0.3)
+        + 0.35 * min(1.0, features['number_end_ratio'] / 0.4)
+        + 0.25 * features['has_toc_keyword']
+        + 0.2 * list_structure
+    )
+    # Figure/table lists share every TOC signal, never decide them locally
+    if features['has_non_toc_keyword']:
+        score = min(score, 0.5)
+    return min(score, 1.0)
+
+
+def _has_toc_structure(features):
+    """
+    Whether any structural TOC signal is present, in which case the page is never ruled out locally.
+    """
+    return (
+        features['has_toc_keyword']
+        or features['dot_leader_ratio'] >= 0.1
+        or features['number_end_ratio'] >= 0.2
+        or features['numbered_start_ratio'] >= 0.2
+        or features['heading_line_ratio'] >= 0.5
+    )
+
+
+def score_toc_page(text):
+    """
+    Score how much a page looks like a table of contents.
+    Args:
+        text (str): The text of the page.
+    Returns:
+        float: A score between 0 (clearly not a TOC page) and 1 (clearly a TOC page).
+    """
+    return _score_features(toc_page_features(text))
+
+
+def classify_toc_page(text, low=0.15, high=0.8):
+    """
+    Decide locally whether a page is a TOC page, leaving ambiguous pages to the LLM.
+    A page is only "no" when it scores below low and shows none of the structural signals of a TOC,
+    so TOCs without page numbers (numbered or plain heading lists) always reach the LLM.
+    Args:
+        text (str): The text of the page.
+        low (float): Pages scoring below this without any TOC structure are clearly not TOC pages.
+        high (float): Pages scoring at or above this are clearly TOC pages.
+    Returns:
+        str: "yes" or "no" when the page is clear-cut, None when it should be sent to the LLM.
+    """
+    features = toc_page_features(text)
+    score = _score_features(features)
+    if score < low and not _has_toc_structure(features):
+        return 'no'
+    if score >= high:
+        return 'yes'
+    return None
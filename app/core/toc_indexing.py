@@ -1,27 +1,28 @@
 import json
+import logging
 import copy
+import asyncio
 from pathlib import Path
 import os
 from dotenv import load_dotenv
-from app.utils.openai_api import ChatGPT_API
+from app.utils.openai_api import ChatGPT_API_async
 from app.utils.json_utils import extract_json, get_json_content
 from app.utils.conversion_utils import convert_physical_index_to_int
+from app.core.toc_utils import page_list_to_group_text
 
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
 
-def toc_index_extractor(toc, content, model=MODEL):
-    print('start toc_index_extractor')
+async def toc_index_extractor(toc, content, model=MODEL):
+    logging.info('start toc_index_extractor')
     tob_extractor_prompt = """
     You are given a table of contents in a json format and several pages of a document, your job is to add the physical_index to the table of contents in the json format.
 
@@ -44,7 +45,7 @@ def toc_index_extractor(toc, content, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = tob_extractor_prompt + '\nTable of contents:\n' + str(toc) + '\nDocument pages:\n' + content
-    response = ChatGPT_API(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
+    response = await ChatGPT_API_async(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
     json_content = extract_json(response)    
     return json_content
 
@@ -96,7 +97,7 @@ def add_page_offset_to_toc_json(data, offset):
     return data
 
 
-def add_page_number_to_toc(part, structure, model=MODEL):
+async def add_page_number_to_toc(part, structure, model=MODEL):
     fill_prompt_seq = """
     You are given an JSON structure of a document and a partial part of the document. Your task is to check if the title that is described in the structure is started in the partial given document.
 
@@ -120,7 +121,7 @@ def add_page_number_to_toc(part, structure, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = fill_prompt_seq + f"\n\nCurrent Partial Document:\n{part}\n\nGiven Structure\n{json.dumps(structure, indent=2)}\n"
-    current_json_raw = ChatGPT_API(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
+    current_json_raw = await ChatGPT_API_async(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
     json_result = extract_json(current_json_raw)
     
     for item in json_result:
@@ -129,39 +130,135 @@ def add_page_number_to_toc(part, structure, model=MODEL):
     return json_result
 
 
-def process_none_page_numbers(toc_items, page_list, start_index=1, model=MODEL):
+def _align_page_number_answers(requested, answer):
+    """
+    Map an add_page_number_to_toc answer back onto the requested items.
+    The answer is matched by position when it has the same length, by title otherwise.
+    Returns:
+        list: The physical_index answered for each requested item, None when it was not found.
+    """
+    if not isinstance(answer, list):
+        return [None] * len(requested)
+    answer = [item for item in answer if isinstance(item, dict)]
+    if len(answer) != len(requested):
+        by_title = {}
+        for item in answer:
+            by_title.setdefault(' '.join(str(item.get('title', '')).split()), item)
+        answer = [by_title.get(' '.join(str(item.get('title', '')).split()), {}) for item in requested]
+
+    physical_indices = []
+    for item in answer:
+        physical_index = item.get('physical_index')
+        if isinstance(physical_index, str) and not physical_index.strip().startswith(('<physical_index_', 'physical_index_')):
+            physical_index = None
+        physical_indices.append(physical_index)
+    return physical_indices
+
+
+async def add_page_number_to_toc_concurrent(group_texts, toc_items, model=MODEL, concurrency=4):
+    """
+    Find the start page of every TOC item across all group texts.
+    The group texts are sent in waves of `concurrency` concurrent requests. Each request only carries the
+    items still unresolved after the previous waves, and when several chunks answer for the same item the
+    earliest chunk in document order wins.
+    Args:
+        group_texts (list): The page groups of the document, in document order.
+        toc_items (list): The TOC items with 'structure' and 'title'.
+        model (str): The model to use for the API calls.
+        concurrency (int): The number of group texts processed at the same time.
+    Returns:
+        list: One {"structure", "title", "physical_index"} item per TOC item, physical_index is None when not found.
+    """
+    results = [
+        {'structure': item.get('structure'), 'title': item.get('title'), 'physical_index': None}
+        for item in toc_items
+    ]
+    concurrency = max(1, concurrency)
+    for wave_start in range(0, len(group_texts), concurrency):
+        unresolved = [k for k, item in enumerate(results) if item['physical_index'] is None]
+        if not unresolved:
+            break
+        requested = [
+            {'structure': results[k]['structure'], 'title': results[k]['title'], 'physical_index': None}
+            for k in unresolved
+        ]
+        wave = group_texts[wave_start:wave_start + concurrency]
+        answers = await asyncio.gather(*[
+            add_page_number_to_toc(group_text, copy.deepcopy(requested), model)
+            for group_text in wave
+        ])
+        for answer in answers:
+            for k, physical_index in zip(unresolved, _align_page_number_answers(requested, answer)):
+                if results[k]['physical_index'] is None and physical_index is not None:
+                    results[k]['physical_index'] = physical_index
+    return results
+
+
+async def process_none_page_numbers(toc_items, page_list, start_index=1, model=MODEL, max_tokens=20000):
+    """
+    Find the physical index of TOC items that have none, looking between their resolved neighbours.
+    Consecutive unresolved items share the same bracket of pages, so each run of them is resolved
+    with a single request, and the runs are resolved concurrently.
+    A bracket of more than max_tokens tokens (e.g. from the last resolved item to the end of the document)
+    is split into page groups that are searched in turn, until every item of the run is found.
+    """
+    end_index = len(page_list) + start_index - 1
+
+    # Group consecutive items without physical_index into windows bracketed by resolved items
+    windows = []
+    current_window = []
     for i, item in enumerate(toc_items):
         if "physical_index" not in item:
-            # logger.info(f"fix item: {item}")
-            # Find previous physical_index
-            prev_physical_index = 0  # Default if no previous item exists
-            for j in range(i - 1, -1, -1):
-                if toc_items[j].get('physical_index') is not None:
-                    prev_physical_index = toc_items[j]['physical_index']
-                    break
-            
-            # Find next physical_index
-            next_physical_index = -1  # Default if no next item exists
-            for j in range(i + 1, len(toc_items)):
-                if toc_items[j].get('physical_index') is not None:
-                    next_physical_index = toc_items[j]['physical_index']
-                    break
-
-            page_contents = []
-            for page_index in range(prev_physical_index, next_physical_index+1):
-                # Add bounds checking to prevent IndexError
-                list_index = page_index - start_index
-                if list_index >= 0 and list_index < len(page_list):
-                    page_text = f"<physical_index_{page_index}>\n{page_list[list_index][0]}\n<physical_index_{page_index}>\n\n"
-                    page_contents.append(page_text)
-                else:
-                    continue
-
-            item_copy = copy.deepcopy(item)
-            del item_copy['page']
-            result = add_page_number_to_toc(page_contents, item_copy, model)
-            if isinstance(result[0]['physical_index'], str) and result[0]['physical_index'].startswith('<physical_index'):
-                item['physical_index'] = int(result[0]['physical_index'].split('_')[-1].rstrip('>').strip())
-                del item['page']
+            current_window.append(i)
+        elif current_window:
+            windows.append(current_window)
+            current_window = []
+    if current_window:
+        windows.append(current_window)
+
+    async def resolve_window(window):
+        # Find previous physical_index
+        prev_physical_index = 0  # Default if no previous item exists
+        for j in range(window[0] - 1, -1, -1):
+            if toc_items[j].get('physical_index') is not None:
+                prev_physical_index = toc_items[j]['physical_index']
+                break
+
+        # Find next physical_index
+        next_physical_index = end_index  # Default if no next item exists
+        for j in range(window[-1] + 1, len(toc_items)):
+            if toc_items[j].get('physical_index') is not None:
+                next_physical_index = toc_items[j]['physical_index']
+                break
+
+        page_contents = []
+        token_lengths = []
+        for page_index in range(prev_physical_index, next_physical_index+1):
+            # Add bounds checking to prevent IndexError
+            list_index = page_index - start_index
+            if list_index >= 0 and list_index < len(page_list):
+                page_text = f"<physical_index_{page_index}>\n{page_list[list_index][0]}\n<physical_index_{page_index}>\n\n"
+                page_contents.append(page_text)
+                token_lengths.append(page_list[list_index][1])
+
+        requested = []
+        for i in window:
+            item_copy = copy.deepcopy(toc_items[i])
+            item_copy.pop('page', None)
+            requested.append(item_copy)
+        group_texts = page_list_to_group_text(page_contents, token_lengths, max_tokens=max_tokens)
+        if len(group_texts) == 1:
+            result = await add_page_number_to_toc(group_texts[0], requested, model)
+            return _align_page_number_answers(requested, result)
+        result = await add_page_number_to_toc_concurrent(group_texts, requested, model, concurrency=1)
+        return [item['physical_index'] for item in result]
+
+    window_results = await asyncio.gather(*[resolve_window(window) for window in windows])
+    for window, physical_indices in zip(windows, window_results):
+        for i, physical_index in zip(window, physical_indices):
+            physical_index = convert_physical_index_to_int(physical_index) if isinstance(physical_index, str) else physical_index
+            if isinstance(physical_index, int):
+                toc_items[i]['physical_index'] = physical_index
+                toc_items[i].pop('page', None)
     
-    return toc_items
\ No newline at end of file
+    return toc_items
@@ -1,8 +1,9 @@
 import json
+import logging
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from app.utils.openai_api import ChatGPT_API, ChatGPT_API_with_finish_reason, ChatGPT_API_async
+from app.utils.openai_api import ChatGPT_API_with_finish_reason_async
 from app.utils.json_utils import extract_json, get_json_content
 from app.utils.conversion_utils import convert_page_to_int
 from app.core.toc_validation_llm import check_if_toc_transformation_is_complete
@@ -12,15 +13,13 @@ env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
-def toc_transformer(toc_content, model=MODEL):
-    print('start toc_transformer')
+async def toc_transformer(toc_content, model=MODEL):
+    logging.info('start toc_transformer')
     init_prompt = """
     You are given a table of contents, You job is to transform the whole table of content into a JSON format included table_of_contents.
 
@@ -41,9 +40,9 @@ def toc_transformer(toc_content, model=MODEL):
     Directly return the final JSON structure, do not output anything else. """
 
     prompt = init_prompt + '\n Given table of contents\n:' + toc_content
-    last_complete, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, 
+    last_complete, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, 
                                                                  base_url=BASE_URL, api_key=API_KEY)
-    if_complete = check_if_toc_transformation_is_complete(toc_content, last_complete, model)
+    if_complete = await check_if_toc_transformation_is_complete(toc_content, last_complete, model)
     if if_complete == "yes" and finish_reason == "finished":
         last_complete = extract_json(last_complete)
         cleaned_response=convert_page_to_int(last_complete['table_of_contents'])
@@ -66,14 +65,14 @@ def toc_transformer(toc_content, model=MODEL):
 
         Please continue the json structure, directly output the remaining part of the json structure."""
 
-        new_complete, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, api_key=API_KEY,
+        new_complete, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, api_key=API_KEY,
                                                                  base_url=BASE_URL)
 
         if new_complete.startswith('```json'):
             new_complete =  get_json_content(new_complete)
             last_complete = last_complete+new_complete
 
-        if_complete = check_if_toc_transformation_is_complete(toc_content, last_complete, model)
+        if_complete = await check_if_toc_transformation_is_complete(toc_content, last_complete, model)
         
 
     last_complete = json.loads(last_complete)
@@ -82,8 +81,8 @@ def toc_transformer(toc_content, model=MODEL):
     return cleaned_response
 
 
-def generate_toc_continue(toc_content, part, model=MODEL):
-    print('start generate_toc_continue')
+async def generate_toc_continue(toc_content, part, model=MODEL):
+    logging.info('start generate_toc_continue')
     prompt = """
     You are an expert in extracting hierarchical tree structure.
     You are given a tree structure of the previous part and the text of the current part.
@@ -110,7 +109,7 @@ def generate_toc_continue(toc_content, part, model=MODEL):
     Directly return the additional part of the final JSON structure. Do not output anything else."""
 
     prompt = prompt + '\nGiven text\n:' + part + '\nPrevious tree structure\n:' + json.dumps(toc_content, indent=2)
-    response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, api_key=API_KEY,
+    response, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, api_key=API_KEY,
                                                               base_url=BASE_URL)
     if finish_reason == 'finished':
         return extract_json(response)
@@ -118,8 +117,8 @@ def generate_toc_continue(toc_content, part, model=MODEL):
         raise Exception(f'finish reason: {finish_reason}')
     
 
-def generate_toc_init(part, model=MODEL):
-    print('start generate_toc_init')
+async def generate_toc_init(part, model=MODEL):
+    logging.info('start generate_toc_init')
     prompt = """
     You are an expert in extracting hierarchical tree structure, your task is to generate the tree structure of the document.
 
@@ -145,7 +144,7 @@ def generate_toc_init(part, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = prompt + '\nGiven text\n:' + part
-    response, finish_reason = ChatGPT_API_with_finish_reason(model=model, prompt=prompt, 
+    response, finish_reason = await ChatGPT_API_with_finish_reason_async(model=model, prompt=prompt, 
                                                               api_key=API_KEY, base_url=BASE_URL)
 
     if finish_reason == 'finished':
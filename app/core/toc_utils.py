@@ -1,5 +1,7 @@
 import re
+import logging
 import math
+from app.utils.conversion_utils import convert_physical_index_to_int
 
 def remove_page_number(data):
     if isinstance(data, dict):
@@ -45,7 +47,7 @@ def page_list_to_group_text(page_contents, token_lengths, max_tokens=20000, over
     if current_subset:
         subsets.append(''.join(current_subset))
     
-    print('divide page_list to groups', len(subsets))
+    logging.info(f'divide page_list to groups {len(subsets)}')
     return subsets
 
 
@@ -59,4 +61,48 @@ def remove_first_physical_index_section(text):
     if match:
         # Remove the first matched section
         return text.replace(match.group(0), '', 1)
-    return text
\ No newline at end of file
+    return text
+
+
+def renumber_structure(items):
+    """
+    Rewrite the 'structure' index of a flat TOC list so it is consecutive, keeping each item's depth.
+    E.g. depths 1, 2, 2, 1 become "1", "1.1", "1.2", "2" whatever the original numbers were.
+    """
+    counters = []
+    for item in items:
+        structure = item.get('structure')
+        depth = len(str(structure).strip('.').split('.')) if structure else 1
+        depth = min(depth, len(counters) + 1)
+        counters = counters[:depth]
+        if len(counters) < depth:
+            counters.append(0)
+        counters[-1] += 1
+        item['structure'] = '.'.join(str(counter) for counter in counters)
+    return items
+
+
+def merge_chunk_tocs(chunk_tocs):
+    """
+    Stitch the TOC lists generated independently for each group text into one list.
+    Consecutive group texts overlap by one page, so sections found on the overlap page twice are kept once.
+    The structure indices are renumbered afterwards, since every chunk numbers its sections from 1.
+    Args:
+        chunk_tocs (list): One list of {"structure", "title", "physical_index"} items per group text, in document order.
+    Returns:
+        list: The merged TOC list with int physical indices.
+    """
+    merged = []
+    seen = set()
+    for chunk_toc in chunk_tocs:
+        if not isinstance(chunk_toc, list):
+            continue
+        chunk_toc = convert_physical_index_to_int([item for item in chunk_toc if isinstance(item, dict)])
+        for item in chunk_toc:
+            title = ' '.join(str(item.get('title', '')).split()).lower()
+            key = (title, item.get('physical_index'))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    return renumber_structure(merged)
@@ -1,9 +1,13 @@
+import json
+import logging
 import asyncio
 import random
+import math
+from statistics import NormalDist
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from app.utils.openai_api import ChatGPT_API_async, ChatGPT_API
+from app.utils.openai_api import ChatGPT_API_async
 from app.utils.json_utils import extract_json
 from app.utils.conversion_utils import convert_physical_index_to_int
 
@@ -12,15 +16,13 @@ env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
 
-async def check_title_appearance(item, page_list, start_index=1, model=MODEL):    
+async def check_title_appearance(item, page_list, start_index=1, model=MODEL, matcher=None):    
     title=item['title']
     if 'physical_index' not in item or item['physical_index'] is None:
         return {'list_index': item.get('list_index'), 'answer': 'no', 'title':title, 'page_number': None}
@@ -29,7 +31,12 @@ async def check_title_appearance(item, page_list, start_index=1, model=MODEL):
     page_number = item['physical_index']
     page_text = page_list[page_number-start_index][0]
 
-    
+    local_answer = None
+    if matcher is not None:
+        local_answer = matcher.match_in_page(title, page_text)
+        if local_answer is not None and not matcher.should_shadow():
+            return {'list_index': item['list_index'], 'answer': local_answer, 'title': title, 'page_number': page_number}
+
     prompt = f"""
     Your job is to check if the given section appears or starts in the given page_text.
 
@@ -52,10 +59,117 @@ async def check_title_appearance(item, page_list, start_index=1, model=MODEL):
         answer = response['answer']
     else:
         answer = 'no'
+    if local_answer is not None:
+        matcher.record_shadow(local_answer, answer)
     return {'list_index': item['list_index'], 'answer': answer, 'title': title, 'page_number': page_number}
 
 
-async def check_title_appearance_in_start(title, page_text, model=MODEL, logger=None):    
+def _parse_batch_answers(response, count, answer_key):
+    """
+    Map a JSON array answer of a batched prompt back to the asked items by their list_index.
+    Items the model did not answer default to "no".
+    """
+    answers = ['no'] * count
+    response = extract_json(response)
+    if not isinstance(response, list):
+        return answers
+    for entry in response:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get('list_index'))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < count and entry.get(answer_key) in ('yes', 'no'):
+            answers[index] = entry[answer_key]
+    return answers
+
+
+async def check_title_appearance_batch(items, page_list, start_index=1, model=MODEL):
+    """
+    Check in one request whether each of several sections appears or starts on their shared physical_index page.
+    Args:
+        items (list): TOC items with 'title', 'list_index' and the same 'physical_index'.
+    Returns:
+        list: One result per item, in the format of check_title_appearance.
+    """
+    page_number = items[0]['physical_index']
+    page_text = page_list[page_number-start_index][0]
+    titles = json.dumps([{'list_index': k, 'title': item['title']} for k, item in enumerate(items)], ensure_ascii=False)
+
+    prompt = f"""
+    Your job is to check, for each of the given sections, if the section appears or starts in the given page_text.
+
+    Note: do fuzzy matching, ignore any space inconsistency in the page_text.
+
+    The given sections are {titles}.
+    The given page_text is {page_text}.
+    
+    Reply format:
+    [
+        {{
+            "list_index": <list_index of the section>,
+            "thinking": <why do you think the section appears or starts in the page_text>,
+            "answer": "yes or no" (yes if the section appears or starts in the page_text, no otherwise)
+        }},
+        ...
+    ]
+    Answer for every given section. Directly return the final JSON structure. Do not output anything else."""
+
+    response = await ChatGPT_API_async(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
+    answers = _parse_batch_answers(response, len(items), 'answer')
+    return [
+        {'list_index': item['list_index'], 'answer': answer, 'title': item['title'], 'page_number': page_number}
+        for item, answer in zip(items, answers)
+    ]
+
+
+async def check_title_appearance_grouped(items, page_list, start_index=1, model=MODEL, matcher=None):
+    """
+    Check the appearance of many TOC items, asking once per page for all the items located on that page.
+    Returns:
+        list: One result per item, in the order of items.
+    """
+    results = [None] * len(items)
+    pending_by_page = {}
+    shadowed = {}
+    for k, item in enumerate(items):
+        if item.get('physical_index') is None:
+            results[k] = {'list_index': item.get('list_index'), 'answer': 'no', 'title': item['title'], 'page_number': None}
+            continue
+        if matcher is not None:
+            page_text = page_list[item['physical_index']-start_index][0]
+            local_answer = matcher.match_in_page(item['title'], page_text)
+            if local_answer is not None:
+                if not matcher.should_shadow():
+                    results[k] = {'list_index': item['list_index'], 'answer': local_answer, 'title': item['title'], 'page_number': item['physical_index']}
+                    continue
+                shadowed[k] = local_answer
+        pending_by_page.setdefault(item['physical_index'], []).append(k)
+
+    groups = list(pending_by_page.values())
+    group_results = await asyncio.gather(*[
+        check_title_appearance(items[group[0]], page_list, start_index, model) if len(group) == 1
+        else check_title_appearance_batch([items[k] for k in group], page_list, start_index, model)
+        for group in groups
+    ])
+    for group, group_result in zip(groups, group_results):
+        if len(group) == 1:
+            group_result = [group_result]
+        for k, result in zip(group, group_result):
+            results[k] = result
+            if k in shadowed:
+                matcher.record_shadow(shadowed[k], result['answer'])
+    return results
+
+
+async def check_title_appearance_in_start(title, page_text, model=MODEL, logger=None, matcher=None):    
+    local_answer = None
+    if matcher is not None:
+        local_answer = matcher.match_at_start(title, page_text)
+        if local_answer is not None and not matcher.should_shadow():
+            return local_answer
+
     prompt = f"""
     You will be given the current section title and the current page_text.
     Your job is to check if the current section starts in the beginning of the given page_text.
@@ -77,11 +191,53 @@ async def check_title_appearance_in_start(title, page_text, model=MODEL, logger=
     response = await ChatGPT_API_async(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
     response = extract_json(response)
     if logger:
-        logger.info(f"Response: {response}")
+        logger.debug(lambda: f"Response: {response}")
+    if local_answer is not None:
+        matcher.record_shadow(local_answer, response.get("start_begin", "no"))
     return response.get("start_begin", "no")
 
 
-async def check_title_appearance_in_start_concurrent(structure, page_list, model=MODEL, logger=None):
+async def check_titles_appearance_in_start_batch(titles, page_text, model=MODEL, logger=None):
+    """
+    Check in one request, for several section titles located on the same page, whether each section starts
+    in the beginning of the page.
+    Returns:
+        list: "yes" or "no" for each title, in the order of titles.
+    """
+    sections = json.dumps([{'list_index': k, 'title': title} for k, title in enumerate(titles)], ensure_ascii=False)
+    prompt = f"""
+    You will be given several section titles and the current page_text.
+    Your job is to check, for each section, if the section starts in the beginning of the given page_text.
+    If there are other contents before a section title, then that section does not start in the beginning of the given page_text.
+    If a section title is the first content in the given page_text, then that section starts in the beginning of the given page_text.
+
+    Note: do fuzzy matching, ignore any space inconsistency in the page_text.
+
+    The given sections are {sections}.
+    The given page_text is {page_text}.
+    
+    reply format:
+    [
+        {{
+            "list_index": <list_index of the section>,
+            "thinking": <why do you think the section starts or does not start in the beginning of the page_text>,
+            "start_begin": "yes or no" (yes if the section starts in the beginning of the page_text, no otherwise)
+        }},
+        ...
+    ]
+    Answer for every given section. Directly return the final JSON structure. Do not output anything else."""
+
+    response = await ChatGPT_API_async(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
+    answers = _parse_batch_answers(response, len(titles), 'start_begin')
+    if logger:
+        logger.debug(lambda: f"Batch response: {answers}")
+    return answers
+
+
+async def check_title_appearance_in_start_concurrent(structure, page_list, model=MODEL, logger=None, matcher=None):
+    """
+    Set 'appear_start' on every TOC item. Items located on the same page are checked with a single request.
+    """
     if logger:
         logger.info("Checking title appearance in start concurrently")
     
@@ -90,28 +246,49 @@ async def check_title_appearance_in_start_concurrent(structure, page_list, model
         if item.get('physical_index') is None:
             item['appear_start'] = 'no'
 
-    # only for items with valid physical_index
-    tasks = []
-    valid_items = []
-    for item in structure:
-        if item.get('physical_index') is not None:
+    # only for items with valid physical_index, grouped by page
+    pending_by_page = {}
+    shadowed = {}
+    for list_index, item in enumerate(structure):
+        if item.get('physical_index') is None:
+            continue
+        if matcher is not None:
             page_text = page_list[item['physical_index'] - 1][0]
-            tasks.append(check_title_appearance_in_start(item['title'], page_text, model=model, logger=logger))
-            valid_items.append(item)
+            local_answer = matcher.match_at_start(item['title'], page_text)
+            if local_answer is not None:
+                if not matcher.should_shadow():
+                    item['appear_start'] = local_answer
+                    continue
+                shadowed[list_index] = local_answer
+        pending_by_page.setdefault(item['physical_index'], []).append(list_index)
+
+    groups = list(pending_by_page.items())
+    tasks = []
+    for physical_index, group in groups:
+        page_text = page_list[physical_index - 1][0]
+        if len(group) == 1:
+            tasks.append(check_title_appearance_in_start(structure[group[0]]['title'], page_text, model=model, logger=logger))
+        else:
+            titles = [structure[list_index]['title'] for list_index in group]
+            tasks.append(check_titles_appearance_in_start_batch(titles, page_text, model=model, logger=logger))
 
     results = await asyncio.gather(*tasks, return_exceptions=True)
-    for item, result in zip(valid_items, results):
+    for (physical_index, group), result in zip(groups, results):
         if isinstance(result, Exception):
             if logger:
-                logger.error(f"Error checking start for {item['title']}: {result}")
-            item['appear_start'] = 'no'
-        else:
-            item['appear_start'] = result
+                logger.error(f"Error checking start for page {physical_index}: {result}")
+            result = ['no'] * len(group)
+        elif len(group) == 1:
+            result = [result]
+        for list_index, answer in zip(group, result):
+            structure[list_index]['appear_start'] = answer
+            if list_index in shadowed:
+                matcher.record_shadow(shadowed[list_index], answer)
 
     return structure
 
 
-def check_if_toc_extraction_is_complete(content, toc, model=MODEL):
+async def check_if_toc_extraction_is_complete(content, toc, model=MODEL):
     prompt = f"""
     You are given a partial document  and a  table of contents.
     Your job is to check if the  table of contents is complete, which it contains all the main sections in the partial document.
@@ -124,12 +301,12 @@ def check_if_toc_extraction_is_complete(content, toc, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = prompt + '\n Document:\n' + content + '\n Table of contents:\n' + toc
-    response = ChatGPT_API(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
+    response = await ChatGPT_API_async(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
     json_content = extract_json(response)
     return json_content['completed']
 
 
-def check_if_toc_transformation_is_complete(content, toc, model=MODEL):
+async def check_if_toc_transformation_is_complete(content, toc, model=MODEL):
     prompt = f"""
     You are given a raw table of contents and a  table of contents.
     Your job is to check if the  table of contents is complete.
@@ -142,12 +319,12 @@ def check_if_toc_transformation_is_complete(content, toc, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = prompt + '\n Raw Table of contents:\n' + content + '\n Cleaned Table of contents:\n' + toc
-    response = ChatGPT_API(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
+    response = await ChatGPT_API_async(model=model, prompt=prompt, api_key=API_KEY, base_url=BASE_URL)
     json_content = extract_json(response)
     return json_content['completed']
 
 
-def single_toc_item_index_fixer(section_title, content, model=MODEL):
+async def single_toc_item_index_fixer(section_title, content, model=MODEL):
     tob_extractor_prompt = """
     You are given a section title and several pages of a document, your job is to find the physical index of the start page of the section in the partial document.
 
@@ -161,13 +338,13 @@ def single_toc_item_index_fixer(section_title, content, model=MODEL):
     Directly return the final JSON structure. Do not output anything else."""
 
     prompt = tob_extractor_prompt + '\nSection Title:\n' + str(section_title) + '\nDocument pages:\n' + content
-    response = ChatGPT_API(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
+    response = await ChatGPT_API_async(model=model, prompt=prompt, base_url=BASE_URL, api_key=API_KEY)
     json_content = extract_json(response)    
     return convert_physical_index_to_int(json_content['physical_index'])
 
 
-async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results, start_index=1, model=MODEL, logger=None):
-    print(f'start fix_incorrect_toc with {len(incorrect_results)} incorrect results')
+async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results, start_index=1, model=MODEL, logger=None, matcher=None):
+    logging.info(f'start fix_incorrect_toc with {len(incorrect_results)} incorrect results')
     incorrect_indices = {result['list_index'] for result in incorrect_results}
     
     end_index = len(page_list) + start_index - 1
@@ -229,12 +406,12 @@ async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results,
                 continue
         content_range = ''.join(page_contents)
         
-        physical_index_int = single_toc_item_index_fixer(incorrect_item['title'], content_range, model)
+        physical_index_int = await single_toc_item_index_fixer(incorrect_item['title'], content_range, model)
         
         # Check if the result is correct
         check_item = incorrect_item.copy()
         check_item['physical_index'] = physical_index_int
-        check_result = await check_title_appearance(check_item, page_list, start_index, model)
+        check_result = await check_title_appearance(check_item, page_list, start_index, model, matcher=matcher)
 
         return {
             'list_index': list_index,
@@ -251,7 +428,7 @@ async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results,
     results = await asyncio.gather(*tasks, return_exceptions=True)
     for item, result in zip(incorrect_results, results):
         if isinstance(result, Exception):
-            print(f"Processing item {item} generated an exception: {result}")
+            logging.error(f"Processing item {item} generated an exception: {result}")
             continue
     results = [result for result in results if not isinstance(result, Exception)]
 
@@ -277,23 +454,23 @@ async def fix_incorrect_toc(toc_with_page_number, page_list, incorrect_results,
                 'physical_index': result['physical_index'],
             })
 
-    logger.info(f'incorrect_results_and_range_logs: {incorrect_results_and_range_logs}')
-    logger.info(f'invalid_results: {invalid_results}')
+    logger.debug(lambda: f'incorrect_results_and_range_logs: {incorrect_results_and_range_logs}')
+    logger.debug(lambda: f'invalid_results: {invalid_results}')
 
     return toc_with_page_number, invalid_results
 
 
 
-async def fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results, start_index=1, max_attempts=3, model=MODEL, logger=None):
-    print('start fix_incorrect_toc')
+async def fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorrect_results, start_index=1, max_attempts=3, model=MODEL, logger=None, matcher=None):
+    logging.info('start fix_incorrect_toc')
     fix_attempt = 0
     current_toc = toc_with_page_number
     current_incorrect = incorrect_results
 
     while current_incorrect:
-        print(f"Fixing {len(current_incorrect)} incorrect results")
+        logging.info(f"Fixing {len(current_incorrect)} incorrect results")
         
-        current_toc, current_incorrect = await fix_incorrect_toc(current_toc, page_list, current_incorrect, start_index, model, logger)
+        current_toc, current_incorrect = await fix_incorrect_toc(current_toc, page_list, current_incorrect, start_index, model, logger, matcher=matcher)
                 
         fix_attempt += 1
         if fix_attempt >= max_attempts:
@@ -306,8 +483,44 @@ async def fix_incorrect_toc_with_retries(toc_with_page_number, page_list, incorr
 
 
 ################### verify toc #########################################################
-async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
-    print('start verify_toc')
+def wilson_interval(successes, n, confidence=0.95):
+    """
+    Wilson score interval of a proportion.
+    Returns:
+        tuple: The lower and upper bounds of the interval.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def stratified_sample(indices, k):
+    """
+    Pick k items spread over the whole list: one random item from each of k equal, consecutive strata.
+    """
+    if k >= len(indices):
+        return list(indices)
+    bounds = [round(s * len(indices) / k) for s in range(k + 1)]
+    return [indices[random.randrange(bounds[s], bounds[s + 1])] for s in range(k) if bounds[s + 1] > bounds[s]]
+
+
+async def verify_toc(page_list, list_result, start_index=1, N=None, model=None,
+                     sample_size=None, confidence=0.95, threshold=0.6, max_rounds=3, logger=None, matcher=None):
+    """
+    Check that the TOC items appear on their physical_index page and return the accuracy and the incorrect items.
+    With sample_size, stratified samples are checked first, one after another, until the confidence interval
+    of the accuracy is clearly below threshold (the TOC is then rejected without checking the rest) or clearly
+    above it (the remaining items are then checked too, since every incorrect item is needed to fix the TOC).
+    The sample doubles every round and after max_rounds rounds the remaining items are checked in one
+    concurrent batch, so a TOC close to the threshold costs at most max_rounds + 1 sequential steps.
+    A fully correct TOC can never be confirmed from a sample alone.
+    """
+    logging.info('start verify_toc')
     # Find the last non-None physical_index
     last_physical_index = None
     for item in reversed(list_result):
@@ -321,11 +534,11 @@ async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
     
     # Determine which items to check
     if N is None:
-        print('check all items')
+        logging.info('check all items')
         sample_indices = range(0, len(list_result))
     else:
         N = min(N, len(list_result))
-        print(f'check {N} items')
+        logging.info(f'check {N} items')
         sample_indices = random.sample(range(0, len(list_result)), N)
 
     # Prepare items with their list indices
@@ -338,12 +551,39 @@ async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
             item_with_index['list_index'] = idx  # Add the original index in list_result
             indexed_sample_list.append(item_with_index)
 
+    async def check_items(items):
+        return await check_title_appearance_grouped(items, page_list, start_index, model, matcher=matcher)
+
+    # Sequential sampling: check stratified batches until the accuracy is clearly on one side of the threshold
+    results = []
+    remaining = list(range(len(indexed_sample_list)))
+    if sample_size and sample_size < len(indexed_sample_list):
+        for round_index in range(max_rounds):
+            if not remaining:
+                break
+            batch = stratified_sample(remaining, sample_size * 2 ** round_index)
+            results.extend(await check_items([indexed_sample_list[k] for k in batch]))
+            checked = set(batch)
+            remaining = [k for k in remaining if k not in checked]
+
+            correct = sum(1 for result in results if result['answer'] == 'yes')
+            lower, upper = wilson_interval(correct, len(results), confidence)
+            logging.info(f'sampled {len(results)} items, accuracy interval: [{lower:.2f}, {upper:.2f}]')
+            if upper < threshold:
+                # Clearly below the threshold, the TOC is rejected without checking the rest
+                accuracy = correct / len(results)
+                calls_saved = len(remaining)
+                logging.info(f"accuracy (sampled): {accuracy*100:.2f}%, {calls_saved} checks saved")
+                if logger:
+                    logger.info({'verify_toc': 'sampled', 'checked': len(results), 'calls_saved': calls_saved,
+                                 'accuracy': accuracy, 'interval': [lower, upper]})
+                return accuracy, [result for result in results if result['answer'] != 'yes']
+            if lower > threshold:
+                # Clearly above the threshold, escalate to the full check
+                break
+
     # Run checks concurrently
-    tasks = [
-        check_title_appearance(item, page_list, start_index, model)
-        for item in indexed_sample_list
-    ]
-    results = await asyncio.gather(*tasks)
+    results.extend(await check_items([indexed_sample_list[k] for k in remaining]))
     
     # Process results
     correct_count = 0
@@ -357,5 +597,5 @@ async def verify_toc(page_list, list_result, start_index=1, N=None, model=None):
     # Calculate accuracy
     checked_count = len(results)
     accuracy = correct_count / checked_count if checked_count > 0 else 0
-    print(f"accuracy: {accuracy*100:.2f}%")
-    return accuracy, incorrect_results
\ No newline at end of file
+    logging.info(f"accuracy: {accuracy*100:.2f}%")
+    return accuracy, incorrect_results
@@ -0,0 +1,201 @@
+# The code is to cache LLM responses on disk, keyed by a hash of the model and the messages sent.
+# All prompts of the pipeline run at temperature 0, so reprocessing a document mostly hits the cache.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm_cache.sqlite")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class LLMResponseCache:
+    """
+    SQLite backed response cache with size-based LRU eviction and hit/miss counters.
+    Safe to share between threads and between processes using the same file.
+    The total size is kept up to date by triggers, so a store does not scan the table, and the last access
+    times of hits are written in batches, at most every access_flush_interval seconds, instead of on every hit.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, access_flush_interval=30.0):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.access_flush_interval = access_flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._pending_access = {}
+        self._last_access_flush = time.monotonic()
+
+    def _connection(self):
+        # A connection must not be shared with a forked child process, reopen it if the pid changed
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT, finish_reason TEXT, "
+                "size INTEGER, created_at REAL, last_access REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            # Running total of the entry sizes, maintained by the triggers in the same transaction as every change
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache_meta (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_size_insert AFTER INSERT ON llm_cache BEGIN "
+                "UPDATE llm_cache_meta SET value = value + NEW.size WHERE name = 'total_size'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_size_delete AFTER DELETE ON llm_cache BEGIN "
+                "UPDATE llm_cache_meta SET value = value - OLD.size WHERE name = 'total_size'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_size_update AFTER UPDATE OF size ON llm_cache BEGIN "
+                "UPDATE llm_cache_meta SET value = value + NEW.size - OLD.size WHERE name = 'total_size'; END"
+            )
+            # Caches created before the running total start from the size of their entries
+            conn.execute(
+                "INSERT OR IGNORE INTO llm_cache_meta (name, value) "
+                "SELECT 'total_size', COALESCE(SUM(size), 0) FROM llm_cache"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            self._pending_access = {}
+        return self._conn
+
+    @staticmethod
+    def make_key(model, messages, base_url=None):
+        """
+        Hash of the request. base_url keeps the answers of different endpoints serving the same model name apart.
+        """
+        request = {"model": model, "messages": messages, "temperature": 0}
+        if base_url:
+            request["base_url"] = base_url.rstrip("/")
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response.
+        Returns:
+            tuple: The response text and the finish reason, or None on a miss.
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute("SELECT content, finish_reason FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._pending_access[key] = time.time()
+                    if time.monotonic() - self._last_access_flush >= self.access_flush_interval:
+                        self._flush_access(conn)
+                        conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache lookup failed: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key, model, content, finish_reason):
+        size = len(content.encode("utf-8")) if content else 0
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                # An upsert, not INSERT OR REPLACE, so that replacing an entry fires the size update trigger
+                conn.execute(
+                    "INSERT INTO llm_cache (key, model, content, finish_reason, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET model = excluded.model, "
+                    "content = excluded.content, finish_reason = excluded.finish_reason, size = excluded.size, "
+                    "created_at = excluded.created_at, last_access = excluded.last_access",
+                    (key, model, content, finish_reason, size, now, now),
+                )
+                conn.commit()
+                self._evict(conn)
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache store failed: {e}")
+
+    def _flush_access(self, conn):
+        """Write the last access times of the hits since the previous flush, in the caller's transaction."""
+        if self._pending_access:
+            conn.executemany("UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                             [(accessed_at, key) for key, accessed_at in self._pending_access.items()])
+            self._pending_access = {}
+        self._last_access_flush = time.monotonic()
+
+    def _total_size(self, conn):
+        return conn.execute("SELECT value FROM llm_cache_meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _evict(self, conn):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes."""
+        total = self._total_size(conn)
+        if total <= self.max_bytes:
+            return
+        # The recency order has to include the hits not written yet
+        self._flush_access(conn)
+        target = int(self.max_bytes * 0.9)
+        rows = conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale_keys.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale_keys)
+        conn.commit()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            size = self._total_size(conn)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._pending_access = {}
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    Get the process-wide LLM response cache.
+    Returns:
+        LLMResponseCache: The shared cache, or None if LLM_CACHE_ENABLED is not "yes".
+    """
+    global _llm_cache
+    if LLM_CACHE_ENABLED.lower() not in ("yes", "true", "1"):
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+    return _llm_cache
@@ -0,0 +1,121 @@
+# The code is to keep a process-wide pool of LLM api clients and to cap the number of in-flight requests per provider.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import os
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+import openai
+from dotenv import load_dotenv
+load_dotenv()
+
+# Maximum number of concurrent requests sent to one provider (base_url, api_key)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+_lock = threading.Lock()
+_sync_clients = {}
+_sync_semaphores = {}
+# Async clients and semaphores are bound to the event loop that created them,
+# page_index_main runs more than one event loop so they are kept per loop, and closed with aclose_async_clients()
+# before their loop ends.
+_async_clients = weakref.WeakKeyDictionary()
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def _provider_key(api_key, base_url):
+    return (base_url or "", api_key or "")
+
+
+def get_client(api_key, base_url):
+    """
+    Get the shared synchronous client for a provider, creating it on first use.
+    The SDK's own retries are disabled, retrying is left to app.utils.retry_utils.
+    Args:
+        api_key (str): The API key for authentication.
+        base_url (str): The base URL for the API endpoint.
+    Returns:
+        openai.OpenAI: A client reusing keep-alive connections across calls.
+    """
+    key = _provider_key(api_key, base_url)
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+            _sync_clients[key] = client
+    return client
+
+
+def get_async_client(api_key, base_url):
+    """
+    Get the shared asynchronous client for a provider in the running event loop.
+    Args:
+        api_key (str): The API key for authentication.
+        base_url (str): The base URL for the API endpoint.
+    Returns:
+        openai.AsyncOpenAI: A client reusing keep-alive connections across calls.
+    """
+    loop = asyncio.get_running_loop()
+    key = _provider_key(api_key, base_url)
+    with _lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+            loop_clients[key] = client
+    return client
+
+
+async def aclose_async_clients():
+    """
+    Close the asynchronous clients of the running event loop and their connections.
+    Await it before the loop ends, a client dropped together with its loop leaves its sockets open.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_clients.pop(loop, {})
+        _async_semaphores.pop(loop, None)
+    for client in loop_clients.values():
+        await client.close()
+
+
+def _get_sync_semaphore(key):
+    with _lock:
+        semaphore = _sync_semaphores.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+            _sync_semaphores[key] = semaphore
+    return semaphore
+
+
+def _get_async_semaphore(key):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_semaphores = _async_semaphores.setdefault(loop, {})
+        semaphore = loop_semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            loop_semaphores[key] = semaphore
+    return semaphore
+
+
+@contextmanager
+def request_slot(api_key, base_url):
+    """
+    Block until a request slot is free for the provider, and release it on exit.
+    """
+    semaphore = _get_sync_semaphore(_provider_key(api_key, base_url))
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def async_request_slot(api_key, base_url):
+    """
+    Wait until a request slot is free for the provider in the running event loop, and release it on exit.
+    """
+    semaphore = _get_async_semaphore(_provider_key(api_key, base_url))
+    async with semaphore:
+        yield
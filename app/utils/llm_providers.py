@@ -0,0 +1,308 @@
+# The code is to define the LLM providers behind the ChatGPT_API* wrappers of openai_api.py, selected by LLM_PROVIDER:
+#   openai - the OpenAI compatible endpoint (DeepSeek by default)
+#   replay - answers recorded with LLM_RECORD_PATH, looked up by the LLM cache key of the request
+#   fake   - synthesized answers for every pipeline prompt, with a configurable latency and error distribution
+# replay and fake need no network and no API key, so the whole pipeline can run offline, in CI and in load tests.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import os
+import re
+import abc
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+import httpx
+import openai
+from dotenv import load_dotenv
+from app.utils.llm_client_utils import get_client, get_async_client
+from app.utils.cache_utils import LLMResponseCache
+from app.utils.retry_utils import LLMConfigurationError
+load_dotenv()
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+# Append every answer of the provider to this JSON-Lines file, to be replayed later with LLM_PROVIDER=replay
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "./cache/llm_recording.jsonl")
+# Replayed answers wait for their recorded latency multiplied by this factor (0 = answer at once)
+LLM_REPLAY_TIME_SCALE = float(os.getenv("LLM_REPLAY_TIME_SCALE", "1.0"))
+# Fake answers wait for a log-normal latency of this median (seconds) and sigma, and fail with this probability
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.5"))
+LLM_FAKE_LATENCY_SIGMA = float(os.getenv("LLM_FAKE_LATENCY_SIGMA", "0.5"))
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0.0"))
+LLM_FAKE_ERROR_STATUS = int(os.getenv("LLM_FAKE_ERROR_STATUS", "503"))
+LLM_FAKE_SEED = os.getenv("LLM_FAKE_SEED", "0")
+# A fake section starts every LLM_FAKE_PAGES_PER_SECTION pages
+LLM_FAKE_PAGES_PER_SECTION = int(os.getenv("LLM_FAKE_PAGES_PER_SECTION", "3"))
+
+LLMResponse = namedtuple("LLMResponse", ["content", "finish_reason", "prompt_tokens", "completion_tokens"])
+
+
+class LLMReplayMissError(LLMConfigurationError):
+    """The replay recording has no answer for the request."""
+
+
+class LLMProvider(abc.ABC):
+    """
+    Answers chat completion requests. Retries, concurrency slots, caching and tracing are left to openai_api.
+    Errors are raised as they are and classified by retry_utils.is_retryable.
+    """
+    name = None
+    # Whether the answers may be stored in and served from the on-disk LLM response cache
+    cacheable = False
+
+    @abc.abstractmethod
+    def complete(self, model, messages, api_key, base_url):
+        """
+        Returns:
+            LLMResponse: The answer, its finish reason ("finished" or "max_output_reached") and its token usage.
+        """
+
+    async def complete_async(self, model, messages, api_key, base_url):
+        return await asyncio.to_thread(self.complete, model, messages, api_key, base_url)
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    cacheable = True
+
+    @staticmethod
+    def _check_api_key(api_key):
+        if not api_key:
+            raise LLMConfigurationError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
+
+    @staticmethod
+    def _parse_response(response):
+        content = response.choices[0].message.content
+        finish_reason = "max_output_reached" if response.choices[0].finish_reason == "length" else "finished"
+        usage = getattr(response, "usage", None)
+        return LLMResponse(content, finish_reason, getattr(usage, "prompt_tokens", 0) or 0,
+                           getattr(usage, "completion_tokens", 0) or 0)
+
+    def complete(self, model, messages, api_key, base_url):
+        self._check_api_key(api_key)
+        response = get_client(api_key, base_url).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,
+        )
+        return self._parse_response(response)
+
+    async def complete_async(self, model, messages, api_key, base_url):
+        self._check_api_key(api_key)
+        response = await get_async_client(api_key, base_url).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,
+        )
+        return self._parse_response(response)
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Replays the answers of a LLM_RECORD_PATH recording. A request that was not recorded fails without retrying.
+    """
+    name = "replay"
+
+    def __init__(self, path=LLM_REPLAY_PATH, time_scale=LLM_REPLAY_TIME_SCALE):
+        self.path = path
+        self.time_scale = time_scale
+        self.records = {}
+        if not os.path.isfile(path):
+            raise LLMConfigurationError(f"LLM replay recording {path} not found, record one with LLM_RECORD_PATH.")
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.records[record["key"]] = record
+
+    def _lookup(self, model, messages):
+        key = LLMResponseCache.make_key(model, messages)
+        record = self.records.get(key)
+        if record is None:
+            raise LLMReplayMissError(f"No recorded answer for request {key[:12]} (model {model}) in {self.path}.")
+        return record, record.get("latency", 0.0) * self.time_scale
+
+    @staticmethod
+    def _response(record):
+        return LLMResponse(record["content"], record["finish_reason"], record.get("prompt_tokens", 0),
+                           record.get("completion_tokens", 0))
+
+    def complete(self, model, messages, api_key, base_url):
+        record, delay = self._lookup(model, messages)
+        time.sleep(delay)
+        return self._response(record)
+
+    async def complete_async(self, model, messages, api_key, base_url):
+        record, delay = self._lookup(model, messages)
+        await asyncio.sleep(delay)
+        return self._response(record)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Synthesizes a well-formed answer for every prompt of the pipeline: no TOC is detected, a section starts on the
+    first line of every LLM_FAKE_PAGES_PER_SECTION-th page, and every title check answers yes.
+    The latency and the failures of a request only depend on the seed, the request and how often it was sent,
+    so a run is reproducible whatever the scheduling of the concurrent requests.
+    """
+    name = "fake"
+
+    def __init__(self, latency=LLM_FAKE_LATENCY, latency_sigma=LLM_FAKE_LATENCY_SIGMA, error_rate=LLM_FAKE_ERROR_RATE,
+                 error_status=LLM_FAKE_ERROR_STATUS, seed=LLM_FAKE_SEED, pages_per_section=LLM_FAKE_PAGES_PER_SECTION):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self.pages_per_section = max(1, pages_per_section)
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    def _draw(self, model, messages):
+        """
+        Returns:
+            tuple: Seconds to wait and whether the request fails.
+        """
+        key = LLMResponseCache.make_key(model, messages)
+        with self._lock:
+            sent = self._sent.get(key, 0)
+            self._sent[key] = sent + 1
+        rng = random.Random(f"{self.seed}:{key}:{sent}")
+        delay = self.latency * math.exp(rng.gauss(0, self.latency_sigma)) if self.latency > 0 else 0.0
+        return delay, rng.random() < self.error_rate
+
+    def _error(self):
+        request = httpx.Request("POST", "http://fake-llm.local/v1/chat/completions")
+        headers = {"retry-after": "1"} if self.error_status == 429 else None
+        response = httpx.Response(self.error_status, request=request, headers=headers)
+        if self.error_status == 429:
+            return openai.RateLimitError("Fake rate limit", response=response, body=None)
+        return openai.InternalServerError(f"Fake error {self.error_status}", response=response, body=None)
+
+    def _response(self, messages):
+        prompt = messages[-1]["content"]
+        content = self.answer(prompt)
+        return LLMResponse(content, "finished", len(prompt) // 4, len(content) // 4)
+
+    def complete(self, model, messages, api_key, base_url):
+        delay, fails = self._draw(model, messages)
+        time.sleep(delay)
+        if fails:
+            raise self._error()
+        return self._response(messages)
+
+    async def complete_async(self, model, messages, api_key, base_url):
+        delay, fails = self._draw(model, messages)
+        await asyncio.sleep(delay)
+        if fails:
+            raise self._error()
+        return self._response(messages)
+
+    def answer(self, prompt):
+        """
+        Build the answer to one pipeline prompt, recognized by the keys of its reply format.
+        """
+        if '"toc_detected"' in prompt:
+            return json.dumps({"thinking": "No table of contents on this page.", "toc_detected": "no"})
+        if '"page_index_given_in_toc"' in prompt:
+            return json.dumps({"thinking": "No page numbers.", "page_index_given_in_toc": "no"})
+        answer_key = "start_begin" if '"start_begin"' in prompt else "answer"
+        if '"list_index"' in prompt:
+            indices = sorted({int(index) for index in re.findall(r'"list_index": (\d+)', prompt)})
+            return json.dumps([{"list_index": index, "thinking": "Found.", answer_key: "yes"} for index in indices])
+        if '"start_begin"' in prompt or '"answer"' in prompt:
+            return json.dumps({"thinking": "Found.", answer_key: "yes"})
+        if '"completed"' in prompt:
+            return json.dumps({"thinking": "Complete.", "completed": "yes"})
+        pages = re.findall(r'<physical_index_(\d+)>\n(.*?)\n<physical_index_\1>', prompt, re.DOTALL)
+        if '"structure"' in prompt and pages:
+            return json.dumps(self._sections(pages), ensure_ascii=False)
+        if '"physical_index"' in prompt and pages:
+            return json.dumps({"thinking": "First page.", "physical_index": f"<physical_index_{pages[0][0]}>"})
+        # Summaries and descriptions: quote the longest line, which is document text rather than instructions
+        longest_line = max(prompt.splitlines(), key=len, default="")
+        return "A part of the document about: " + " ".join(longest_line.split()[:30])
+
+    def _sections(self, pages):
+        sections = []
+        for page_index, page_text in pages:
+            lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+            if not lines or (int(page_index) - 1) % self.pages_per_section != 0:
+                continue
+            sections.append({"structure": str(len(sections) + 1), "title": lines[0][:80],
+                             "physical_index": f"<physical_index_{page_index}>"})
+        return sections
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Passes requests to another provider and appends every answer to a JSON-Lines recording for ReplayProvider.
+    """
+
+    def __init__(self, provider, path=LLM_RECORD_PATH):
+        self.provider = provider
+        self.name = provider.name
+        # Every request must reach the provider to be recorded, cached answers would be missing from the replay
+        self.cacheable = False
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _record(self, model, messages, response, latency):
+        record = {"key": LLMResponseCache.make_key(model, messages), "model": model, "latency": round(latency, 3),
+                  **response._asdict()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def complete(self, model, messages, api_key, base_url):
+        started = time.perf_counter()
+        response = self.provider.complete(model, messages, api_key, base_url)
+        self._record(model, messages, response, time.perf_counter() - started)
+        return response
+
+    async def complete_async(self, model, messages, api_key, base_url):
+        started = time.perf_counter()
+        response = await self.provider.complete_async(model, messages, api_key, base_url)
+        await asyncio.to_thread(self._record, model, messages, response, time.perf_counter() - started)
+        return response
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "replay": ReplayProvider,
+    "fake": FakeProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider():
+    """
+    Get the process-wide LLM provider selected by LLM_PROVIDER, recording its answers if LLM_RECORD_PATH is set.
+    Returns:
+        LLMProvider: The shared provider.
+    Raises:
+        LLMConfigurationError: If LLM_PROVIDER is unknown or the replay recording is missing.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            provider_class = PROVIDERS.get(LLM_PROVIDER.lower())
+            if provider_class is None:
+                raise LLMConfigurationError(f"Unknown LLM_PROVIDER {LLM_PROVIDER}, expected one of {list(PROVIDERS)}.")
+            provider = provider_class()
+            if LLM_RECORD_PATH:
+                provider = RecordingProvider(provider, LLM_RECORD_PATH)
+            logging.info(f"LLM provider: {provider.name}")
+            _provider = provider
+    return _provider
@@ -1,11 +1,16 @@
 # The code is to define logging utilities for the application using Rich.
+# Log entries are appended to a JSON-Lines file through a buffered writer with size-based rotation;
+# export_json_array() produces the former JSON array format on demand.
 # Author: Shibo Li
 # Date: 2025-05-30
 # Version: 0.1.0
 
 import json
+import atexit
+import threading
 from datetime import datetime
 import os
+from dotenv import load_dotenv
 from app.utils.pdf_utils import get_pdf_name
 from rich.console import Console
 from rich.logging import RichHandler
@@ -14,46 +19,182 @@ from rich.panel import Panel
 from rich.text import Text
 from rich.table import Table
 import logging
+load_dotenv()
+
+# Rotate a log file once it exceeds LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT older files
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Buffered entries are written at least every LOG_FLUSH_INTERVAL seconds
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+
+
+class JsonLinesWriter:
+    """
+    Append-only JSON-Lines writer. Entries are serialized once, buffered in memory and appended
+    by a background thread, so the cost of a write does not depend on the size of the log.
+    Args:
+        path (str): Path of the .jsonl file.
+        max_bytes (int): Size from which the file is rotated to path.1, path.2, ... (0 = never).
+        backup_count (int): Number of rotated files kept.
+        flush_interval (float): Seconds between background flushes.
+        max_buffered (int): Number of buffered entries that triggers an immediate flush.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 flush_interval=LOG_FLUSH_INTERVAL, max_buffered=1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._buffer_lock:
+            self._buffer.append(line)
+            flush_now = len(self._buffer) >= self.max_buffered
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        with self._file_lock:
+            with self._buffer_lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            data = "".join(lines).encode("utf-8")
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def _rotate(self):
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to write log file {self.path}: {e}")
+
+    def close(self):
+        if not self._closed.is_set():
+            self._closed.set()
+            self._flusher.join()
+            self.flush()
+            atexit.unregister(self.close)
+
+
+def export_json_array(jsonl_path, output_path=None):
+    """
+    Convert a JSON-Lines log, including its rotated files, into the JSON array format of the former log files.
+    Args:
+        jsonl_path (str): Path of the .jsonl log.
+        output_path (str): Path of the .json file to write, defaults to jsonl_path with a .json extension.
+    Returns:
+        str: The path of the written file.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(jsonl_path)[0] + ".json"
+    rotated = []
+    index = 1
+    while os.path.exists(f"{jsonl_path}.{index}"):
+        rotated.append(f"{jsonl_path}.{index}")
+        index += 1
+    # Oldest rotated file first, the current file last
+    paths = list(reversed(rotated)) + ([jsonl_path] if os.path.exists(jsonl_path) else [])
+    entries = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2, ensure_ascii=False)
+    return output_path
+
+
+# Severity of the JsonLogger levels, entries below the logger level are dropped before being formatted
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 25, "ERROR": 40}
+# Console sinks: "rich" (pretty printing), "plain" (one line per entry) or "none" (log file only)
+CONSOLE_MODES = ("rich", "plain", "none")
+
 
 class JsonLogger:
-    def __init__(self, file_path):
+    """
+    Per-document logger writing to logs/<pdf>_<time>.jsonl and to the console.
+    Messages may be callables, they are only called (and their payload serialized) when the level is enabled.
+    Args:
+        file_path (str or BytesIO or PdfDocument): The document, used to name the log file.
+        level (str): Lowest level written, "DEBUG", "INFO", "SUCCESS" or "ERROR".
+        console (str): Console sink, "rich", "plain" or "none".
+    """
+
+    def __init__(self, file_path, level="DEBUG", console="rich"):
+        if console not in CONSOLE_MODES:
+            raise ValueError(f"Unsupported console mode: {console}")
+        self.level = LOG_LEVELS[level.upper()]
+        self.console_mode = console
+
         # Extract PDF name for logger name
         pdf_name = get_pdf_name(file_path)
         
         current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.filename = f"{pdf_name}_{current_time}.json"
+        self.filename = f"{pdf_name}_{current_time}.jsonl"
         self.pdf_name = pdf_name
         os.makedirs("./logs", exist_ok=True)
         
-        # Initialize Rich console
-        self.console = Console(record=True, width=120)
+        # Initialize Rich console, recording the output is only useful for save_console_output
+        self.console = Console(record=(console == "rich"), width=120)
         
-        # Initialize empty list to store all messages
-        self.log_data = []
+        # Entries are appended to a JSON-Lines file, only the per-level counts are kept in memory
+        self.writer = JsonLinesWriter(self._filepath())
+        self.level_counts = {}
         
         # Setup Rich logger
         self._setup_rich_logger()
         
         # Welcome message
-        self._print_welcome()
+        if self.console_mode == "rich":
+            self._print_welcome()
 
     def _setup_rich_logger(self):
-        """Setup Rich logging handler"""
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format="%(message)s",
-            datefmt="[%X]",
-            handlers=[
-                RichHandler(
-                    console=self.console,
-                    rich_tracebacks=True,
-                    show_path=False,
-                    markup=False
-                )
-            ]
-        )
+        """Setup the logging handler of the console sink, none for the "none" sink"""
+        if self.console_mode == "rich":
+            logging.basicConfig(
+                level=self.level,
+                format="%(message)s",
+                datefmt="[%X]",
+                handlers=[
+                    RichHandler(
+                        console=self.console,
+                        rich_tracebacks=True,
+                        show_path=False,
+                        markup=False
+                    )
+                ]
+            )
+        elif self.console_mode == "plain":
+            logging.basicConfig(level=self.level, format="%(asctime)s %(levelname)s %(message)s")
         self.logger = logging.getLogger(f"JsonLogger-{self.pdf_name}")
 
+    def is_enabled(self, level):
+        """Whether entries of this level are written"""
+        return LOG_LEVELS.get(level, LOG_LEVELS["INFO"]) >= self.level
+
     def _print_welcome(self):
         """Print welcome panel"""
         welcome_text = Text()
@@ -129,24 +270,41 @@ class JsonLogger:
 
     def log(self, level, message, **kwargs):
         """Main logging method"""
+        if not self.is_enabled(level):
+            return
+        # Lazily formatted message
+        if callable(message):
+            message = message()
+
         # Create log entry
         log_entry = self._create_log_entry(level, message, **kwargs)
-        self.log_data.append(log_entry)
+        self.level_counts[level] = self.level_counts.get(level, 0) + 1
         
-        # Print to console with Rich formatting
-        self._print_log_message(level, message, **kwargs)
+        # Print to console with Rich formatting, or as one plain line
+        if self.console_mode == "rich":
+            self._print_log_message(level, message, **kwargs)
+        elif self.console_mode == "plain":
+            self.logger.log(LOG_LEVELS.get(level, LOG_LEVELS["INFO"]), json.dumps(log_entry, ensure_ascii=False, default=str))
         
-        # Write to JSON file
-        self._write_to_file()
-
-    def _write_to_file(self):
-        """Write log data to JSON file"""
+        # Append to the JSON-Lines file
         try:
-            with open(self._filepath(), "w", encoding='utf-8') as f:
-                json.dump(self.log_data, f, indent=2, ensure_ascii=False)
+            self.writer.write(log_entry)
         except Exception as e:
             self.console.print(f"[red]Failed to write log file: {e}[/red]")
 
+    def flush(self):
+        """Write buffered entries to the log file"""
+        self.writer.flush()
+
+    def close(self):
+        """Flush and stop the background writer"""
+        self.writer.close()
+
+    def export_json(self, output_path=None):
+        """Export the log in the JSON array format, returns the written path"""
+        self.flush()
+        return export_json_array(self._filepath(), output_path)
+
     def info(self, message, **kwargs):
         """Log info message"""
         self.log("INFO", message, **kwargs)
@@ -168,28 +326,23 @@ class JsonLogger:
         kwargs["exception"] = True
         
         # Print exception with Rich traceback
-        self.console.print_exception(show_locals=True)
+        if self.console_mode == "rich":
+            self.console.print_exception(show_locals=True)
         
         self.log("ERROR", message, **kwargs)
 
     def print_summary(self):
         """Print summary of logged messages"""
-        if not self.log_data:
+        if not self.level_counts:
             self.console.print("[yellow]No log entries yet[/yellow]")
             return
         
-        # Count messages by level
-        level_counts = {}
-        for entry in self.log_data:
-            level = entry.get('level', 'UNKNOWN')
-            level_counts[level] = level_counts.get(level, 0) + 1
-        
         # Create summary table
         table = Table(title=f"📊 Log Summary for {self.pdf_name}")
         table.add_column("Level", style="bold")
         table.add_column("Count", justify="right")
         
-        for level, count in level_counts.items():
+        for level, count in self.level_counts.items():
             style = self._get_level_style(level)
             table.add_row(level, str(count), style=style)
         
@@ -0,0 +1,258 @@
+# The code is to keep process-wide metrics (counters, gauges, histograms) and render them in the Prometheus text format.
+# Documents are processed in worker processes, so counters and histograms can be taken out of a registry as a delta
+# and merged into the registry of the process serving /metrics.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import math
+import threading
+
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        """
+        Returns:
+            dict: Label value tuples to counts.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def take(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                 for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """
+    Current value of something in this process. A gauge is never merged between processes;
+    set_function() makes it read its value at render time (e.g. a queue length).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """
+        Args:
+            function (callable): Returns the value, or a dict of label value tuples to values for a labelled gauge.
+        """
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            value = self._function()
+            values = value if isinstance(value, dict) else {(): value}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                 for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def take(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                own_counts, own_total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+                self._values[key] = ([a + b for a, b in zip(own_counts, counts)], own_total + total)
+
+    def render(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = self._header()
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def take_delta(self):
+        """
+        Take the counter and histogram values recorded since the last call, resetting them.
+        Returns:
+            dict: Metric name to values, picklable and ready for merge_delta() in another process.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        delta = {}
+        for metric in metrics:
+            if isinstance(metric, (Counter, Histogram)):
+                values = metric.take()
+                if values:
+                    delta[metric.name] = values
+        return delta
+
+    def merge_delta(self, delta):
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in delta.items():
+            metric = metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_REQUESTS = Counter("pageindex_llm_requests_total",
+                       "LLM requests by model and outcome (ok, cache_hit or error).", ["model", "outcome"])
+LLM_REQUEST_DURATION = Histogram("pageindex_llm_request_duration_seconds",
+                                 "LLM request latency including retries, excluding cache hits.", ["model"],
+                                 buckets=LLM_LATENCY_BUCKETS)
+LLM_RETRIES = Counter("pageindex_llm_retries_total", "LLM request retries by model.", ["model"])
+LLM_TOKENS = Counter("pageindex_llm_tokens_total", "LLM tokens by model and type (prompt or completion).",
+                     ["model", "type"])
+STAGE_DURATION = Histogram("pageindex_stage_duration_seconds",
+                           "Time a document spent in each pipeline stage (summed over the spans of the stage).",
+                           ["stage"])
+
+
+def observe_llm_call(model, outcome, seconds, prompt_tokens=0, completion_tokens=0, retries=0):
+    """
+    Record one LLM request made by the openai_api wrappers.
+    Args:
+        outcome (str): "ok", "cache_hit" or "error".
+    """
+    model = model or ""
+    LLM_REQUESTS.inc(model=model, outcome=outcome)
+    if outcome == "cache_hit":
+        return
+    LLM_REQUEST_DURATION.observe(seconds, model=model)
+    if retries:
+        LLM_RETRIES.inc(retries, model=model)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, type="completion")
+
+
+def observe_trace_report(report):
+    """
+    Record the stage durations of one document from its tracing_utils report.
+    """
+    for stage, stats in report.get("stages", {}).items():
+        STAGE_DURATION.observe(stats["seconds"], stage=stage)
+
+
+def llm_cache_hit_ratio():
+    """
+    Share of LLM requests answered from the response cache.
+    """
+    values = LLM_REQUESTS.values()
+    total = sum(values.values())
+    hits = sum(value for (_, outcome), value in values.items() if outcome == "cache_hit")
+    return hits / total if total else 0.0
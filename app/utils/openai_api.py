@@ -6,25 +6,157 @@
 # Version: 0.1.0
 
 import os
-import openai
 import time
 from dotenv import load_dotenv
 import asyncio
+from contextlib import contextmanager
 from pathlib import Path
 import logging
+from app.utils.llm_client_utils import request_slot, async_request_slot
+from app.utils.llm_providers import get_llm_provider
+from app.utils.retry_utils import DEFAULT_RETRY_POLICY, LLMRequestError
+from app.utils.cache_utils import get_llm_cache
+from app.utils.data_structure_utils import structure_to_list
+from app.utils.progress_utils import gather_with_progress
+from app.utils.tracing_utils import trace_llm_call
+from app.utils.metrics_utils import observe_llm_call
 
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
+# A missing key only fails the requests sent to the openai provider, not the import
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
+def _build_messages(prompt, chat_history=None):
+    """Build the message list without mutating the caller's chat history."""
+    if chat_history:
+        return list(chat_history) + [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+def _record_usage(call, response, attempt):
+    """Copy the token usage and the number of retries of a request into its trace record."""
+    call["prompt_tokens"] = response.prompt_tokens
+    call["completion_tokens"] = response.completion_tokens
+    call["retries"] = attempt
+
+
+@contextmanager
+def _instrument_llm_call(model):
+    """
+    Trace one LLM request and record it in the process metrics.
+    Yields the trace record in which the request sets its token usage, retries and cache hit.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    with trace_llm_call(model) as call:
+        try:
+            yield call
+            outcome = "cache_hit" if call["cache_hit"] else "ok"
+        finally:
+            observe_llm_call(model, outcome, time.perf_counter() - started, call["prompt_tokens"],
+                             call["completion_tokens"], call["retries"])
+
+
+def _chat_completion(model, messages, api_key, base_url, retry_policy=None):
+    """
+    Send one chat completion request to the LLM_PROVIDER provider, retrying according to the retry policy.
+    Responses of the openai provider are served from and stored in the on-disk LLM cache when it is enabled.
+    Returns:
+        tuple: The response text and the finish reason.
+    Raises:
+        LLMRequestError: If the request fails for good.
+    """
+    with _instrument_llm_call(model) as call:
+        return _chat_completion_traced(call, model, messages, api_key, base_url, retry_policy)
+
+
+def _chat_completion_traced(call, model, messages, api_key, base_url, retry_policy):
+    provider = get_llm_provider()
+    cache = get_llm_cache() if provider.cacheable else None
+    if cache is not None:
+        cache_key = cache.make_key(model, messages, base_url)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            call["cache_hit"] = True
+            return cached
+
+    retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+    attempt = 0
+    while True:
+        try:
+            with request_slot(api_key, base_url):
+                response = provider.complete(model, messages, api_key, base_url)
+            content, finish_reason = response.content, response.finish_reason
+            _record_usage(call, response, attempt)
+            break
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            try:
+                delay = retry_policy.next_delay(e, attempt)
+            except LLMRequestError as failure:
+                call["retries"] = attempt
+                logging.error(f"Giving up after {failure.attempts} attempts for model {model}: {failure}")
+                raise
+            logging.warning(f"Retrying in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+            attempt += 1
+
+    if cache is not None:
+        cache.set(cache_key, model, content, finish_reason)
+    return content, finish_reason
+
+
+async def _chat_completion_async(model, messages, api_key, base_url, retry_policy=None):
+    """
+    Asynchronous version of _chat_completion.
+    """
+    with _instrument_llm_call(model) as call:
+        return await _chat_completion_async_traced(call, model, messages, api_key, base_url, retry_policy)
+
+
+async def _chat_completion_async_traced(call, model, messages, api_key, base_url, retry_policy):
+    provider = get_llm_provider()
+    cache = get_llm_cache() if provider.cacheable else None
+    if cache is not None:
+        # SQLite calls may wait up to 30s for another process' write lock, keep them off the event loop
+        cache_key = cache.make_key(model, messages, base_url)
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            call["cache_hit"] = True
+            return cached
+
+    retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+    attempt = 0
+    while True:
+        try:
+            async with async_request_slot(api_key, base_url):
+                response = await provider.complete_async(model, messages, api_key, base_url)
+            content, finish_reason = response.content, response.finish_reason
+            _record_usage(call, response, attempt)
+            break
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            try:
+                delay = retry_policy.next_delay(e, attempt)
+            except LLMRequestError as failure:
+                call["retries"] = attempt
+                logging.error(f"Giving up after {failure.attempts} attempts for model {model}: {failure}")
+                raise
+            logging.warning(f"Retrying in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    if cache is not None:
+        await asyncio.to_thread(cache.set, cache_key, model, content, finish_reason)
+    return content, finish_reason
+
+
 def ChatGPT_API_with_finish_reason(model, prompt, api_key=API_KEY, chat_history=None, base_url=BASE_URL):
     """
     Function to interact with LLM api and return the response along with finish reason.
@@ -36,36 +168,12 @@ def ChatGPT_API_with_finish_reason(model, prompt, api_key=API_KEY, chat_history=
         base_url (str): The base URL for the API endpoint.
     Returns:
         tuple: A tuple containing the response text and the finish reason.
+    Raises:
+        LLMRequestError: If the request still fails after retrying.
     """
-    max_retries = 10
-    client = openai.OpenAI(api_key=api_key, base_url=base_url)
-    for i in range(max_retries):
-        try:
-            if chat_history:
-                messages = chat_history
-                messages.append({"role": "user", "content": prompt})
-            else:
-                messages = [{"role": "user", "content": prompt}]
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-            )
-            if response.choices[0].finish_reason == "length":
-                return response.choices[0].message.content, "max_output_reached"
-            else:
-                return response.choices[0].message.content, "finished"
+    messages = _build_messages(prompt, chat_history)
+    return _chat_completion(model, messages, api_key, base_url)
 
-        except Exception as e:
-            print('************* Retrying *************')
-            logging.error(f"Error: {e}")
-            if i < max_retries - 1:
-                time.sleep(1)  # Wait before retrying
-            else:
-                logging.error('Max retries reached for prompt: ' + prompt)
-                return "Error"
-            
 
 def ChatGPT_API(model, prompt, api_key=API_KEY, 
                 base_url=BASE_URL, chat_history=None):
@@ -79,36 +187,34 @@ def ChatGPT_API(model, prompt, api_key=API_KEY,
         base_url (str): The base URL for the API endpoint.
     Returns:
         str: The response text from the model.
+    Raises:
+        LLMRequestError: If the request still fails after retrying.
     """
-    max_retries = 10
-    client = openai.OpenAI(api_key=api_key, base_url=base_url)
-    for i in range(max_retries):
-        try:
-            if chat_history:
-                messages = chat_history
-                messages.append({"role": "user", "content": prompt})
-            else:
-                messages = [{"role": "user", "content": prompt}]
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-            )
-   
-            return response.choices[0].message.content
-        except Exception as e:
-            print('************* Retrying *************')
-            logging.error(f"Error: {e}")
-            if i < max_retries - 1:
-                time.sleep(1)  # Wait for 1s before retrying
-            else:
-                logging.error('Max retries reached for prompt: ' + prompt)
-                return "Error"
-            
+    messages = _build_messages(prompt, chat_history)
+    content, _ = _chat_completion(model, messages, api_key, base_url)
+    return content
+
+
+async def ChatGPT_API_with_finish_reason_async(model, prompt, api_key=API_KEY, chat_history=None, base_url=BASE_URL):
+    """
+    Asynchronous function to interact with LLM api and return the response along with finish reason.
+    Args:
+        model (str): The model to use for the API call.
+        prompt (str): The prompt to send to the model.
+        api_key (str): The API key for authentication. 
+        chat_history (list): Optional chat history to include in the request.
+        base_url (str): The base URL for the API endpoint.
+    Returns:
+        tuple: A tuple containing the response text and the finish reason.
+    Raises:
+        LLMRequestError: If the request still fails after retrying.
+    """
+    messages = _build_messages(prompt, chat_history)
+    return await _chat_completion_async(model, messages, api_key, base_url)
+
 
 async def ChatGPT_API_async(model, prompt, api_key=API_KEY, 
-                             base_url=BASE_URL):
+                             base_url=BASE_URL, chat_history=None):
     """
     Asynchronous function to interact with LLM api and return the response.
     Args:
@@ -116,29 +222,16 @@ async def ChatGPT_API_async(model, prompt, api_key=API_KEY,
         prompt (str): The prompt to send to the model.
         api_key (str): The API key for authentication. 
         base_url (str): The base URL for the API endpoint.
+        chat_history (list): Optional chat history to include in the request.
     Returns:
         str: The response text from the model.
+    Raises:
+        LLMRequestError: If the request still fails after retrying.
     """
-    max_retries = 10
-    client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
-    for i in range(max_retries):
-        try:
-            messages = [{"role": "user", "content": prompt}]
-            response = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print('************* Retrying *************')
-            logging.error(f"Error: {e}")
-            if i < max_retries - 1:
-                await asyncio.sleep(1)  # Wait for 1秒 before retrying
-            else:
-                logging.error('Max retries reached for prompt: ' + prompt)
-                return "Error"  
-            
+    messages = _build_messages(prompt, chat_history)
+    content, _ = await _chat_completion_async(model, messages, api_key, base_url)
+    return content
+
 
 async def generate_node_summary(node, model):
     """
@@ -170,7 +263,7 @@ async def generate_summaries_for_structure(structure, model=None):
     """
     nodes = structure_to_list(structure)
     tasks = [generate_node_summary(node, model=model) for node in nodes]
-    summaries = await asyncio.gather(*tasks)
+    summaries = await gather_with_progress('summaries', tasks)
     
     for node, summary in zip(nodes, summaries):
         node['summary'] = summary
@@ -1,4 +1,4 @@
-# The code is dealing with PDF utilities, specifically for extracting the PDF name from a file path.
+# The code is dealing with PDF utilities: opening a PDF once with PyMuPDF or PyPDF2 and serving its pages and metadata.
 # Author: Shibo Li
 # Date: 2025-05-30
 # Version: 0.1.0
@@ -6,76 +6,166 @@
 import PyPDF2
 import pymupdf
 from io import BytesIO
+from contextlib import contextmanager
 import os
-import tiktoken
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import re
 from dotenv import load_dotenv
 from pathlib import Path
-from app.utils.text_utils import sanitize_filename
+from app.utils.text_utils import sanitize_filename, count_tokens_many, physical_index_tag_tokens
+from app.utils.config_utils import ConfigLoader
 load_dotenv()
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
+PDF_PARSERS = ("PyMuPDF", "PyPDF2")
+
+
+class PdfDocument:
+    """
+    A PDF opened once, serving the page text and the metadata from the same handle.
+    Page text is extracted on first access and kept, or for all pages at open time with eager=True.
+    Args:
+        source (str or BytesIO): Path to the PDF file or a BytesIO object.
+        pdf_parser (str): "PyMuPDF" (default, fast) or "PyPDF2".
+        eager (bool): Whether to extract the text of every page right away.
+    """
+
+    def __init__(self, source, pdf_parser="PyMuPDF", eager=False):
+        if pdf_parser not in PDF_PARSERS:
+            raise ValueError(f"Unsupported PDF parser: {pdf_parser}")
+        self.source = source
+        self.pdf_parser = pdf_parser
+        if pdf_parser == "PyMuPDF":
+            if isinstance(source, BytesIO):
+                self._doc = pymupdf.open(stream=source.getvalue(), filetype="pdf")
+            else:
+                self._doc = pymupdf.open(source)
+            self.page_count = self._doc.page_count
+        else:
+            self._doc = PyPDF2.PdfReader(source)
+            self.page_count = len(self._doc.pages)
+        self._texts = [None] * self.page_count
+        if eager:
+            self.get_all_page_texts()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.page_count
+
+    def close(self):
+        if self.pdf_parser == "PyMuPDF" and self._doc is not None:
+            self._doc.close()
+        self._doc = None
+
+    @property
+    def title(self):
+        """Title from the PDF metadata, or 'Untitled' if no title is found."""
+        if self.pdf_parser == "PyMuPDF":
+            title = (self._doc.metadata or {}).get('title')
+        else:
+            meta = self._doc.metadata
+            title = meta.title if meta else None
+        return title if title else 'Untitled'
+
+    @property
+    def name(self):
+        """File name for a path, sanitized metadata title for a BytesIO object."""
+        if isinstance(self.source, str):
+            return os.path.basename(self.source)
+        return sanitize_filename(self.title)
+
+    def get_page_text(self, page_num):
+        """
+        Get the text of one page.
+        Args:
+            page_num (int): Page number (0-indexed).
+        Returns:
+            str: Extracted text of the page.
+        """
+        text = self._texts[page_num]
+        if text is None:
+            if self.pdf_parser == "PyMuPDF":
+                text = self._doc[page_num].get_text()
+            else:
+                text = self._doc.pages[page_num].extract_text()
+            self._texts[page_num] = text
+        return text
+
+    def get_all_page_texts(self):
+        return [self.get_page_text(page_num) for page_num in range(self.page_count)]
+
+
+@contextmanager
+def open_pdf(pdf_path, pdf_parser="PyMuPDF"):
+    """
+    Use pdf_path as is if it is already a PdfDocument, otherwise open it for the duration of the block.
+    """
+    if isinstance(pdf_path, PdfDocument):
+        yield pdf_path
+        return
+    with PdfDocument(pdf_path, pdf_parser=pdf_parser) as pdf:
+        yield pdf
+
+
 def extract_text_from_pdf(pdf_path):
     """
     Extract text from a PDF file.
     Args:
-        pdf_path (str): Path to the PDF file.   
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
     Returns:
         str: Extracted text from the PDF.
     """
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
     ###return text not list 
-    text=""
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
-        text+=page.extract_text()
-    return text
+    with open_pdf(pdf_path) as pdf:
+        return "".join(pdf.get_all_page_texts())
 
 
 def get_pdf_title(pdf_path):
     """
     Get the title of a PDF file.
     Args:
-        pdf_path (str): Path to the PDF file.
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
     Returns:
         str: Title of the PDF file, or 'Untitled' if no title is found.
     """
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
-    meta = pdf_reader.metadata
-    title = meta.title if meta and meta.title else 'Untitled'
-    return title
+    with open_pdf(pdf_path) as pdf:
+        return pdf.title
 
 
 def get_text_of_pages(pdf_path, start_page, end_page, tag=True):
     """
     Extract text from specific pages of a PDF file.
     Args:
-        pdf_path (str): Path to the PDF file.
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
         start_page (int): Starting page number (1-indexed).
         end_page (int): Ending page number (1-indexed).
         tag (bool): Whether to include start and end tags for each page.
     Returns:
         str: Extracted text from the specified pages, with optional tags.
     """
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
     text = ""
-    for page_num in range(start_page-1, end_page):
-        page = pdf_reader.pages[page_num]
-        page_text = page.extract_text()
-        if tag:
-            text += f"<start_index_{page_num+1}>\n{page_text}\n<end_index_{page_num+1}>\n"
-        else:
-            text += page_text
+    with open_pdf(pdf_path) as pdf:
+        for page_num in range(start_page-1, end_page):
+            page_text = pdf.get_page_text(page_num)
+            if tag:
+                text += f"<start_index_{page_num+1}>\n{page_text}\n<end_index_{page_num+1}>\n"
+            else:
+                text += page_text
     return text
 
 
@@ -83,46 +173,64 @@ def get_pdf_name(pdf_path):
     """
     Extract the name of a PDF file from its path or metadata.
     Args:
-        pdf_path (str or BytesIO): Path to the PDF file or a BytesIO object.
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
     Returns:
         str: Name of the PDF file, sanitized to remove invalid characters.
     """
-    # Extract PDF name
     if isinstance(pdf_path, str):
-        pdf_name = os.path.basename(pdf_path)
-    elif isinstance(pdf_path, BytesIO):
-        pdf_reader = PyPDF2.PdfReader(pdf_path)
-        meta = pdf_reader.metadata
-        pdf_name = meta.title if meta and meta.title else 'Untitled'
-        pdf_name = sanitize_filename(pdf_name)
-    return pdf_name
-
-
-def get_page_tokens(pdf_path, model=None, pdf_parser="PyPDF2"):
-    enc = tiktoken.get_encoding("o200k_base")
-    if pdf_parser == "PyPDF2":
-        pdf_reader = PyPDF2.PdfReader(pdf_path)
-        page_list = []
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            page_text = page.extract_text()
-            token_length = len(enc.encode(page_text))
-            page_list.append((page_text, token_length))
-        return page_list
-    elif pdf_parser == "PyMuPDF":
-        if isinstance(pdf_path, BytesIO):
-            pdf_stream = pdf_path
-            doc = pymupdf.open(stream=pdf_stream, filetype="pdf")
-        elif isinstance(pdf_path, str) and os.path.isfile(pdf_path) and pdf_path.lower().endswith(".pdf"):
-            doc = pymupdf.open(pdf_path)
+        return os.path.basename(pdf_path)
+    with open_pdf(pdf_path) as pdf:
+        return pdf.name
+
+
+def _page_tokens_of_range(source, pdf_parser, start_page, end_page):
+    """
+    Process pool worker: open the PDF and return (page_text, token_length) for pages [start_page, end_page).
+    source is a file path or the raw bytes of the PDF.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with PdfDocument(source, pdf_parser=pdf_parser) as pdf:
+        page_texts = [pdf.get_page_text(page_num) for page_num in range(start_page, end_page)]
+    return list(zip(page_texts, count_tokens_many(page_texts)))
+
+
+def get_page_tokens(pdf_path, model=None, pdf_parser="PyMuPDF", workers=1, min_pages=None):
+    """
+    Extract the text of every page together with its token count.
+    Documents of at least min_pages pages are split into page ranges that are extracted and tokenized
+    by a pool of worker processes; smaller documents stay in the current process.
+    Args:
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
+        pdf_parser (str): Backend used when pdf_path is not opened yet, "PyMuPDF" or "PyPDF2".
+        workers (int): Number of worker processes, 1 or less disables the process pool.
+        min_pages (int): Page count from which the process pool is used, defaults to pdf_parallel_min_pages of config.yaml.
+    Returns:
+        list: (page_text, token_length) tuples, one per page, in page order.
+    """
+    if min_pages is None:
+        min_pages = ConfigLoader().load().pdf_parallel_min_pages
+    with open_pdf(pdf_path, pdf_parser=pdf_parser) as pdf:
+        if workers > 1 and pdf.page_count >= min_pages:
+            # Workers reopen the document themselves, a BytesIO object is sent as bytes
+            source = pdf.source.getvalue() if isinstance(pdf.source, BytesIO) else pdf.source
+            return _get_page_tokens_parallel(source, pdf.pdf_parser, pdf.page_count, workers)
+        page_texts = pdf.get_all_page_texts()
+    return list(zip(page_texts, count_tokens_many(page_texts)))
+
+
+def _get_page_tokens_parallel(source, pdf_parser, page_count, workers):
+    # A few ranges per worker so that a worker stuck on image-heavy pages does not hold up the others
+    range_size = max(16, math.ceil(page_count / (workers * 4)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+    # spawn: forking a process that runs the API server threads and event loops is not safe
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_page_tokens_of_range, source, pdf_parser, start, end) for start, end in ranges]
         page_list = []
-        for page in doc:
-            page_text = page.get_text()
-            token_length = len(enc.encode(page_text))
-            page_list.append((page_text, token_length))
-        return page_list
-    else:
-        raise ValueError(f"Unsupported PDF parser: {pdf_parser}")
+        for future in futures:
+            page_list.extend(future.result())
+    return page_list
     
 
 def get_text_of_pdf_pages(pdf_pages, start_page, end_page):
@@ -157,17 +265,34 @@ def get_text_of_pdf_pages_with_labels(pdf_pages, start_page, end_page):
     return text
 
 
+def tag_pages_with_physical_index(page_list, start_index=1):
+    """
+    Wrap every page in <physical_index_N> tags for the LLM, sizing each tagged page from the token count
+    already in page_list plus the tag overhead instead of encoding it again.
+    Args:
+        page_list (list): List of tuples containing page text and token length.
+        start_index (int): Physical index of the first page.
+    Returns:
+        tuple: The tagged page texts and their token lengths.
+    """
+    page_contents = []
+    token_lengths = []
+    for page_index, (page_text, token_length) in enumerate(page_list, start=start_index):
+        page_contents.append(f"<physical_index_{page_index}>\n{page_text}\n<physical_index_{page_index}>\n\n")
+        token_lengths.append(token_length + physical_index_tag_tokens(page_index))
+    return page_contents, token_lengths
+
+
 def get_number_of_pages(pdf_path):
     """
     Get the number of pages in a PDF file.
     Args:
-        pdf_path (str): Path to the PDF file.
+        pdf_path (str or BytesIO or PdfDocument): Path to the PDF file, a BytesIO object or an opened PdfDocument.
     Returns:
         int: Number of pages in the PDF file.
     """
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
-    num = len(pdf_reader.pages)
-    return num
+    with open_pdf(pdf_path) as pdf:
+        return pdf.page_count
 
 
 def get_first_start_page_from_text(text):
@@ -0,0 +1,65 @@
+# The code is to report pipeline progress events (stage transitions and counts) to whoever runs the pipeline.
+# The reporter is held in a context variable, so asyncio tasks started by the pipeline inherit it
+# and code that runs without a reporter (e.g. the command line) pays nothing.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_progress_reporter = ContextVar("progress_reporter", default=None)
+
+
+@contextmanager
+def progress_reporter(callback):
+    """
+    Send the progress events emitted inside the block to callback.
+    Args:
+        callback (callable): Called with one event dict: {'stage': ..., 'time': ..., **data}.
+    """
+    token = _progress_reporter.set(callback)
+    try:
+        yield
+    finally:
+        _progress_reporter.reset(token)
+
+
+def emit_progress(stage, **data):
+    """
+    Emit a progress event for the current run, if a reporter is installed.
+    A failing reporter is logged and never interrupts the pipeline.
+    """
+    reporter = _progress_reporter.get()
+    if reporter is None:
+        return
+    try:
+        reporter({"stage": stage, "time": time.time(), **data})
+    except Exception as e:
+        logging.error(f"Progress reporter failed: {e}")
+
+
+async def gather_with_progress(stage, aws, **data):
+    """
+    asyncio.gather that emits stage with done/total counts as the awaitables finish.
+    At most about a hundred events are emitted, whatever the number of awaitables.
+    Returns:
+        list: The results, in the order of aws.
+    """
+    aws = list(aws)
+    total = len(aws)
+    step = max(1, total // 100)
+    done = 0
+
+    async def run(aw):
+        nonlocal done
+        result = await aw
+        done += 1
+        if done == total or done % step == 0:
+            emit_progress(stage, done=done, total=total, **data)
+        return result
+
+    return await asyncio.gather(*[run(aw) for aw in aws])
@@ -0,0 +1,170 @@
+# The code is to define the retry policy used by the LLM api wrappers: exponential backoff with full jitter,
+# honouring of Retry-After headers, and a per-document retry budget.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import os
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import openai
+from dotenv import load_dotenv
+load_dotenv()
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "10"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+LLM_RETRY_BUDGET_RETRIES = int(os.getenv("LLM_RETRY_BUDGET_RETRIES", "50"))
+LLM_RETRY_BUDGET_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_SECONDS", "300"))
+
+# Status codes worth retrying, everything else (400, 401, 403, 404, 422...) fails fast
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class LLMRequestError(Exception):
+    """Raised when an LLM request fails for good, replacing the old "Error" string sentinel."""
+
+    def __init__(self, message, attempts=0, last_error=None):
+        super().__init__(message)
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+class LLMConfigurationError(Exception):
+    """Raised by an LLM provider that cannot answer whatever the number of attempts (e.g. no API key)."""
+
+
+class RetryBudget:
+    """
+    Retries shared by every LLM call made for one document, so a provider outage
+    cannot stall a worker for minutes.
+    """
+
+    def __init__(self, max_retries=LLM_RETRY_BUDGET_RETRIES, max_wait_seconds=LLM_RETRY_BUDGET_SECONDS):
+        self.max_retries = max_retries
+        self.max_wait_seconds = max_wait_seconds
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, delay):
+        """
+        Take one retry of `delay` seconds from the budget.
+        Returns:
+            bool: False if the budget is exhausted, True otherwise.
+        """
+        with self._lock:
+            if self.max_retries is not None and self.retries >= self.max_retries:
+                return False
+            if self.max_wait_seconds is not None and self.wait_seconds + delay > self.max_wait_seconds:
+                return False
+            self.retries += 1
+            self.wait_seconds += delay
+            return True
+
+
+_current_budget = contextvars.ContextVar("retry_budget", default=None)
+
+
+@contextmanager
+def retry_budget(budget=None):
+    """
+    Make `budget` the retry budget of every LLM call made in this context.
+    asyncio.run and asyncio tasks copy the context, so the budget follows the document into coroutines.
+    """
+    if budget is None:
+        budget = RetryBudget()
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def get_retry_after(error):
+    """
+    Read the server's requested wait from Retry-After / Retry-After-Ms headers.
+    Returns:
+        float: Seconds to wait, or None if the error carries no such header.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, LLMConfigurationError):
+        return False
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    # Unexpected errors (e.g. a malformed response) keep being retried as before
+    return True
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=LLM_MAX_RETRIES, base_delay=LLM_RETRY_BASE_DELAY,
+                 max_delay=LLM_RETRY_MAX_DELAY, max_retry_after=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after if max_retry_after is not None else 2 * max_delay
+
+    def compute_delay(self, attempt, error=None):
+        """
+        Delay before retry number `attempt` (0-indexed): the server's Retry-After if given,
+        otherwise full jitter over an exponentially growing window.
+        """
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(self, error, attempt):
+        """
+        Decide what to do after `error` on attempt number `attempt` (0-indexed).
+        Returns:
+            float: Seconds to sleep before the next attempt.
+        Raises:
+            LLMRequestError: If the error is not retryable, the attempts are used up or the retry budget is exhausted.
+        """
+        attempts = attempt + 1
+        if not is_retryable(error):
+            raise LLMRequestError(f"Non-retryable LLM error: {error}", attempts, error) from error
+        if attempts >= self.max_attempts:
+            raise LLMRequestError(f"Max retries reached: {error}", attempts, error) from error
+
+        delay = self.compute_delay(attempt, error)
+        budget = _current_budget.get()
+        if budget is not None and not budget.consume(delay):
+            raise LLMRequestError(f"Retry budget exhausted: {error}", attempts, error) from error
+        return delay
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -6,6 +6,7 @@
 
 import os
 import tiktoken
+from functools import lru_cache
 from dotenv import load_dotenv
 from pathlib import Path
 load_dotenv()
@@ -14,13 +15,23 @@ env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv()
 
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not API_KEY:
-    raise ValueError("API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
 
 BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 MODEL = os.getenv("DEEPSEEK_MODEL")
 
 
+# Tokenizer used for every token budget of the pipeline
+TOKEN_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name=TOKEN_ENCODING):
+    """
+    Get the tiktoken encoder, loaded once per process.
+    """
+    return tiktoken.get_encoding(encoding_name)
+
+
 def count_tokens(text, model=None):
     """
     Count the number of tokens in a given text using the specified model's tokenizer.
@@ -30,11 +41,32 @@ def count_tokens(text, model=None):
     Returns:
         int: The number of tokens in the input text.
     """
-    enc = tiktoken.get_encoding("o200k_base")
-    tokens = enc.encode(text)
+    tokens = get_encoder().encode(text)
     return len(tokens)
 
 
+def count_tokens_many(texts, model=None, num_threads=8):
+    """
+    Count the tokens of many texts at once, encoding them in parallel threads.
+    Args:
+        texts (list): The input texts to tokenize.
+        model (str): The model name to use for tokenization.
+        num_threads (int): Number of threads used by tiktoken.
+    Returns:
+        list: The number of tokens of each text, in order.
+    """
+    return [len(tokens) for tokens in get_encoder().encode_batch(list(texts), num_threads=num_threads)]
+
+
+@lru_cache(maxsize=4096)
+def physical_index_tag_tokens(page_index):
+    """
+    Number of tokens the <physical_index_N> tags add around a page text, so that tagged pages
+    can be sized from the page token count without encoding the page again.
+    """
+    return count_tokens(f"<physical_index_{page_index}>\n") + count_tokens(f"\n<physical_index_{page_index}>\n\n")
+
+
 def sanitize_filename(filename, replacement='-'):
     # In Linux, only '/' and '\0' (null) are invalid in filenames.
     # Null can't be represented in strings, so we only handle '/'.
@@ -0,0 +1,230 @@
+# The code is to trace where the time of a document goes: spans for the pipeline stages and one span per LLM call
+# (latency, prompt/completion tokens, retries, cache hits), aggregated into a per-document report and exportable
+# as OpenTelemetry (OTLP/JSON) spans to a local file.
+# Like the retry budget, the tracer is held in a context variable, so code running without one pays nothing.
+# Author: Shibo Li
+# Date: 2026-10-17
+# Version: 0.1.0
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LLM_SPAN_NAME = "llm.chat"
+
+_current_tracer = ContextVar("tracer", default=None)
+_current_span = ContextVar("trace_span", default=None)
+
+
+class Tracer:
+    """
+    Collects the spans of one document. A span is a dict with span_id, parent_id, name, start_ns, end_ns,
+    attributes and error; LLM calls are spans named LLM_SPAN_NAME whose attributes follow the
+    OpenTelemetry gen_ai conventions.
+    """
+
+    def __init__(self, service_name="pageindex"):
+        self.service_name = service_name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent_id=None, attributes=None):
+        span = {
+            "span_id": os.urandom(8).hex(),
+            "parent_id": parent_id,
+            "name": name,
+            "start_ns": time.time_ns(),
+            "end_ns": None,
+            "attributes": dict(attributes or {}),
+            "error": None,
+        }
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @staticmethod
+    def end_span(span, error=None):
+        span["end_ns"] = time.time_ns()
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+
+    def report(self):
+        """
+        Aggregate the spans by stage name.
+        The seconds of a stage are the summed durations of its spans, including nested stages;
+        spans running concurrently (e.g. large nodes) overlap, so their sum can exceed the wall time.
+        LLM calls are counted in the stage that made them.
+        Returns:
+            dict: trace_id, duration_seconds, llm totals and per-stage statistics in order of first start.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        by_id = {span["span_id"]: span for span in spans}
+        now = time.time_ns()
+
+        def seconds(span):
+            return ((span["end_ns"] or now) - span["start_ns"]) / 1e9
+
+        llm_total = _empty_llm_stats()
+        stages = {}
+        for span in spans:
+            if span["name"] == LLM_SPAN_NAME:
+                continue
+            stage = stages.setdefault(span["name"], {"count": 0, "seconds": 0.0, "errors": 0, "llm": _empty_llm_stats()})
+            stage["count"] += 1
+            stage["seconds"] += seconds(span)
+            stage["errors"] += span["error"] is not None
+        for span in spans:
+            if span["name"] != LLM_SPAN_NAME:
+                continue
+            parent = by_id.get(span["parent_id"])
+            stage = stages.get(parent["name"]) if parent else None
+            for stats in (llm_total, stage["llm"] if stage else None):
+                if stats is not None:
+                    _add_llm_call(stats, span, seconds(span))
+
+        roots = [span for span in spans if span["parent_id"] is None and span["name"] != LLM_SPAN_NAME]
+        return {
+            "trace_id": self.trace_id,
+            "duration_seconds": round(sum(seconds(span) for span in roots), 3),
+            "llm": _round_stats(llm_total),
+            "stages": {name: {**stage, "seconds": round(stage["seconds"], 3), "llm": _round_stats(stage["llm"])}
+                       for name, stage in stages.items()},
+        }
+
+    def to_otlp(self):
+        """
+        Convert the spans to the OTLP/JSON format of an ExportTraceServiceRequest,
+        which the OpenTelemetry collector's otlpjsonfile receiver and most trace viewers can import.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        now = time.time_ns()
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span["span_id"],
+                "name": span["name"],
+                # SPAN_KIND_CLIENT for the LLM requests, SPAN_KIND_INTERNAL for the stages
+                "kind": 3 if span["name"] == LLM_SPAN_NAME else 1,
+                "startTimeUnixNano": str(span["start_ns"]),
+                "endTimeUnixNano": str(span["end_ns"] or now),
+                "attributes": [_otlp_attribute(key, value) for key, value in span["attributes"].items() if value is not None],
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 0},
+            }
+            if span["parent_id"]:
+                otlp_span["parentSpanId"] = span["parent_id"]
+            otlp_spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": __name__, "version": "0.1.0"}, "spans": otlp_spans}],
+            }]
+        }
+
+    def export_otlp(self, path):
+        """
+        Write the spans as one OTLP/JSON line (the otlpjsonfile format) to path.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_otlp(), ensure_ascii=False, default=str) + "\n")
+
+
+def _empty_llm_stats():
+    return {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            "retries": 0, "cache_hits": 0, "errors": 0}
+
+
+def _add_llm_call(stats, span, seconds):
+    attributes = span["attributes"]
+    stats["calls"] += 1
+    stats["seconds"] += seconds
+    stats["prompt_tokens"] += attributes.get("gen_ai.usage.input_tokens") or 0
+    stats["completion_tokens"] += attributes.get("gen_ai.usage.output_tokens") or 0
+    stats["retries"] += attributes.get("llm.retries") or 0
+    stats["cache_hits"] += bool(attributes.get("llm.cache_hit"))
+    stats["errors"] += span["error"] is not None
+
+
+def _round_stats(stats):
+    return {**stats, "seconds": round(stats["seconds"], 3)}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@contextmanager
+def tracing(tracer):
+    """
+    Record the spans of every stage and LLM call made in this context into tracer.
+    asyncio.run and asyncio tasks copy the context, so the tracer follows the document into coroutines.
+    """
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+@contextmanager
+def trace_span(name, **attributes):
+    """
+    Record the block as a span of the current tracer, as a child of the enclosing span.
+    Yields the span attributes, to which the block can add results (e.g. an accuracy).
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield {}
+        return
+    span = tracer.start_span(name, _current_span.get(), attributes)
+    token = _current_span.set(span["span_id"])
+    error = None
+    try:
+        yield span["attributes"]
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.end_span(span, error)
+
+
+@contextmanager
+def trace_llm_call(model):
+    """
+    Record one LLM request, from the cache lookup to the final response, including the retries.
+    Yields a dict in which the caller sets prompt_tokens, completion_tokens, retries and cache_hit.
+    """
+    tracer = _current_tracer.get()
+    call = {"prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "cache_hit": False}
+    if tracer is None:
+        yield call
+        return
+    span = tracer.start_span(LLM_SPAN_NAME, _current_span.get())
+    error = None
+    try:
+        yield call
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        span["attributes"] = {
+            "gen_ai.request.model": model,
+            "gen_ai.usage.input_tokens": call["prompt_tokens"],
+            "gen_ai.usage.output_tokens": call["completion_tokens"],
+            "llm.retries": call["retries"],
+            "llm.cache_hit": call["cache_hit"],
+        }
+        tracer.end_span(span, error)
@@ -0,0 +1,86 @@
+# The code is to compare the cost of one log call as the log grows: rewriting the whole JSON array
+# on every call (the former JsonLogger) versus appending to a JSON-Lines file with JsonLinesWriter.
+# Every entry carries a TOC-like structure, as the pipeline logs whole structures many times per document.
+#
+# Usage:
+#   python -m benchmarks.json_logger_benchmark --entries 2000 --toc-items 200
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from app.utils.logging_utils import JsonLinesWriter, export_json_array
+
+
+def make_entry(index, toc_items):
+    return {
+        "timestamp": time.time(),
+        "level": "INFO",
+        "call": index,
+        "toc": [{"structure": f"{i}", "title": f"Section {i} of the document", "physical_index": i} for i in range(toc_items)],
+    }
+
+
+def rewrite_array(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2, ensure_ascii=False)
+
+
+def run(name, log_call, entries, window):
+    """
+    Call log_call for every entry and report the mean cost per call over consecutive windows.
+    Returns:
+        list: Mean milliseconds per call for each window.
+    """
+    means = []
+    start = time.perf_counter()
+    for index in range(entries):
+        log_call(index)
+        if (index + 1) % window == 0:
+            now = time.perf_counter()
+            means.append((now - start) / window * 1000)
+            start = now
+    print(f"{name}: " + ", ".join(f"{mean:.3f}" for mean in means) + " ms/call per window")
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JsonLogger file writing')
+    parser.add_argument('--entries', type=int, default=2000, help='Number of log calls')
+    parser.add_argument('--toc-items', type=int, default=200, help='TOC items in every logged entry')
+    parser.add_argument('--windows', type=int, default=5, help='Number of windows the calls are split into')
+    args = parser.parse_args()
+    window = max(1, args.entries // args.windows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        array_path = os.path.join(directory, "log.json")
+        logged = []
+
+        def array_call(index):
+            logged.append(make_entry(index, args.toc_items))
+            rewrite_array(array_path, logged)
+
+        jsonl_path = os.path.join(directory, "log.jsonl")
+        writer = JsonLinesWriter(jsonl_path, max_bytes=0)
+
+        def jsonl_call(index):
+            writer.write(make_entry(index, args.toc_items))
+
+        array_means = run("rewrite JSON array", array_call, args.entries, window)
+        jsonl_means = run("append JSON-Lines ", jsonl_call, args.entries, window)
+        start = time.perf_counter()
+        writer.close()
+        print(f"final JSON-Lines flush: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        export_json_array(jsonl_path, os.path.join(directory, "export.json"))
+        print(f"export to the JSON array format: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        print('\n=== Summary ===')
+        print(f"last/first window cost, rewrite JSON array: {array_means[-1] / array_means[0]:.1f}x")
+        print(f"last/first window cost, append JSON-Lines:  {jsonl_means[-1] / jsonl_means[0]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
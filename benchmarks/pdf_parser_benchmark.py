@@ -0,0 +1,82 @@
+# The code is to compare the PyMuPDF and PyPDF2 backends of PdfDocument on local PDFs:
+# wall time to extract the text of every page, peak Python heap (tracemalloc) and peak process RSS.
+# Every backend/file pair runs in a fresh process so the peak RSS of one run does not leak into the next.
+#
+# Usage:
+#   python -m benchmarks.pdf_parser_benchmark --pdf-dir docs --repeat 3
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import multiprocessing
+from app.utils.pdf_utils import PDF_PARSERS, PdfDocument
+
+
+def _extract(pdf_path, pdf_parser, eager, queue):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with PdfDocument(pdf_path, pdf_parser=pdf_parser, eager=eager) as pdf:
+        page_count = pdf.page_count
+        characters = sum(len(text) for text in pdf.get_all_page_texts())
+    seconds = time.perf_counter() - start
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    queue.put((page_count, characters, seconds, heap_peak, max_rss))
+
+
+def run_once(pdf_path, pdf_parser, eager):
+    """
+    Extract every page of one PDF with one backend in a child process.
+    Returns:
+        tuple: Page count, extracted characters, seconds, peak traced heap bytes and peak RSS bytes.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_extract, args=(pdf_path, pdf_parser, eager, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the PDF text extraction backends')
+    parser.add_argument('--pdf-dir', type=str, required=True, help='Directory of PDF files')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per backend and file, the fastest one is reported')
+    parser.add_argument('--parsers', type=str, nargs='+', default=list(PDF_PARSERS), choices=PDF_PARSERS)
+    parser.add_argument('--eager', action='store_true', help='Extract every page when the document is opened')
+    args = parser.parse_args()
+
+    totals = {pdf_parser: {'pages': 0, 'seconds': 0.0, 'heap_peak': 0, 'max_rss': 0} for pdf_parser in args.parsers}
+    for filename in sorted(os.listdir(args.pdf_dir)):
+        if not filename.lower().endswith('.pdf'):
+            continue
+        pdf_path = os.path.join(args.pdf_dir, filename)
+        line = f'{filename}:'
+        for pdf_parser in args.parsers:
+            runs = [run_once(pdf_path, pdf_parser, args.eager) for _ in range(args.repeat)]
+            page_count, characters, seconds, heap_peak, max_rss = min(runs, key=lambda run: run[2])
+            totals[pdf_parser]['pages'] += page_count
+            totals[pdf_parser]['seconds'] += seconds
+            totals[pdf_parser]['heap_peak'] = max(totals[pdf_parser]['heap_peak'], heap_peak)
+            totals[pdf_parser]['max_rss'] = max(totals[pdf_parser]['max_rss'], max_rss)
+            line += (f' | {pdf_parser}: {page_count} pages, {characters} chars, {seconds:.2f}s, '
+                     f'heap {heap_peak / 2**20:.1f} MiB, rss {max_rss / 2**20:.1f} MiB')
+        print(line)
+
+    print('\n=== Summary ===')
+    for pdf_parser, total in totals.items():
+        pages_per_second = total['pages'] / total['seconds'] if total['seconds'] else 0.0
+        print(f"{pdf_parser}: {total['pages']} pages in {total['seconds']:.2f}s ({pages_per_second:.0f} pages/s), "
+              f"max heap {total['heap_peak'] / 2**20:.1f} MiB, max rss {total['max_rss'] / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
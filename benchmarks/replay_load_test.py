@@ -0,0 +1,114 @@
+# The code is to load test the real pipeline offline: documents are processed by worker processes, as in the API job
+# queue, while the LLM is answered by the fake provider (synthetic latency and error distribution) or by the replay
+# of a recording. Reports the document throughput, LLM request rate and latency percentiles, retries and the time
+# spent per stage, from the trace report of every document.
+#
+# Usage:
+#   python -m benchmarks.replay_load_test --pdf docs/four-lectures.pdf --documents 8 --workers 4 --provider fake
+#   # record once against the real endpoint, then replay the recording with the recorded latencies
+#   LLM_RECORD_PATH=cache/llm_recording.jsonl python main.py --pdf_path docs/four-lectures.pdf
+#   python -m benchmarks.replay_load_test --pdf docs/four-lectures.pdf --provider replay --replay-path cache/llm_recording.jsonl
+
+import argparse
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _process(pdf_path, summaries):
+    # Imported in the worker, after main() has set the provider environment variables
+    from app.core.document_parser import page_index_main
+    from app.utils.config_utils import ConfigLoader
+    from app.utils.tracing_utils import LLM_SPAN_NAME, Tracer
+
+    opt = ConfigLoader().load({"log_level": "ERROR", "log_console": "none", "if_add_node_summary": summaries})
+    tracer = Tracer()
+    start = time.perf_counter()
+    error = None
+    try:
+        page_index_main(pdf_path, opt, tracer=tracer)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    llm_latencies = [(span["end_ns"] - span["start_ns"]) / 1e9 for span in tracer.spans
+                     if span["name"] == LLM_SPAN_NAME and span["end_ns"]]
+    return seconds, tracer.report(), llm_latencies, error
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the pipeline with an offline LLM provider')
+    parser.add_argument('--pdf', type=str, nargs='+', required=True, help='PDF files, processed in turn')
+    parser.add_argument('--documents', type=int, default=8, help='Number of documents to process')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes, as JOB_WORKERS of the API')
+    parser.add_argument('--provider', type=str, default='fake', choices=['fake', 'replay'])
+    parser.add_argument('--summaries', type=str, default='no', help='Whether to generate node summaries')
+    parser.add_argument('--llm-concurrency', type=int, default=8, help='LLM_MAX_CONCURRENCY of every worker')
+    parser.add_argument('--fake-latency', type=float, default=0.5, help='Median fake LLM latency in seconds')
+    parser.add_argument('--fake-latency-sigma', type=float, default=0.5, help='Sigma of the log-normal fake latency')
+    parser.add_argument('--fake-error-rate', type=float, default=0.0, help='Share of fake LLM requests failing')
+    parser.add_argument('--fake-error-status', type=int, default=503, help='HTTP status of the fake failures')
+    parser.add_argument('--seed', type=str, default='0', help='Seed of the fake latency and failures')
+    parser.add_argument('--replay-path', type=str, default='./cache/llm_recording.jsonl', help='Recording to replay')
+    parser.add_argument('--replay-time-scale', type=float, default=1.0, help='Factor applied to the recorded latencies')
+    args = parser.parse_args()
+
+    # Spawned workers inherit the environment, the providers read it when they are imported
+    os.environ.update({
+        'LLM_PROVIDER': args.provider,
+        'LLM_CACHE_ENABLED': 'no',
+        'LLM_MAX_CONCURRENCY': str(args.llm_concurrency),
+        'LLM_FAKE_LATENCY': str(args.fake_latency),
+        'LLM_FAKE_LATENCY_SIGMA': str(args.fake_latency_sigma),
+        'LLM_FAKE_ERROR_RATE': str(args.fake_error_rate),
+        'LLM_FAKE_ERROR_STATUS': str(args.fake_error_status),
+        'LLM_FAKE_SEED': args.seed,
+        'LLM_REPLAY_PATH': args.replay_path,
+        'LLM_REPLAY_TIME_SCALE': str(args.replay_time_scale),
+    })
+    os.environ.pop('LLM_RECORD_PATH', None)
+
+    documents = [args.pdf[index % len(args.pdf)] for index in range(args.documents)]
+    reports, latencies, failures = [], [], 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {executor.submit(_process, pdf_path, args.summaries): pdf_path for pdf_path in documents}
+        for future in as_completed(futures):
+            seconds, report, llm_latencies, error = future.result()
+            reports.append(report)
+            latencies.extend(llm_latencies)
+            failures += error is not None
+            print(f"{os.path.basename(futures[future])}: {seconds:.2f}s, {report['llm']['calls']} LLM calls, "
+                  f"{report['llm']['retries']} retries" + (f", failed: {error}" if error else ""))
+    wall_seconds = time.perf_counter() - start
+
+    llm_calls = sum(report['llm']['calls'] for report in reports)
+    tokens = sum(report['llm']['prompt_tokens'] + report['llm']['completion_tokens'] for report in reports)
+    print('\n=== Summary ===')
+    print(f"{len(reports)} documents ({failures} failed) in {wall_seconds:.2f}s with {args.workers} workers: "
+          f"{len(reports) / wall_seconds * 60:.1f} documents/min")
+    print(f"LLM: {llm_calls} calls ({llm_calls / wall_seconds:.1f}/s), {tokens / wall_seconds:.0f} tokens/s, "
+          f"{sum(report['llm']['retries'] for report in reports)} retries, "
+          f"latency p50 {percentile(latencies, 0.5):.3f}s p95 {percentile(latencies, 0.95):.3f}s "
+          f"p99 {percentile(latencies, 0.99):.3f}s")
+
+    stages = {}
+    for report in reports:
+        for name, stage in report['stages'].items():
+            total = stages.setdefault(name, {'seconds': 0.0, 'llm_calls': 0})
+            total['seconds'] += stage['seconds']
+            total['llm_calls'] += stage['llm']['calls']
+    print('Mean per document and stage:')
+    for name, total in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        print(f"  {name}: {total['seconds'] / len(reports):.2f}s, {total['llm_calls'] / len(reports):.1f} LLM calls")
+
+
+if __name__ == '__main__':
+    main()
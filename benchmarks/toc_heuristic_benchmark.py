@@ -0,0 +1,166 @@
+# The code is to measure the recall/precision of the local TOC page pre-filter on a local PDF corpus,
+# and how many toc_detector_single_page LLM calls it saves during TOC discovery.
+#
+# Usage:
+#   python -m benchmarks.toc_heuristic_benchmark --pdf-dir docs --labels toc_labels.json
+#
+# The labels file maps each PDF file name to the 0-based indices of its TOC pages, e.g.
+#   {"manual.pdf": [2, 3], "paper.pdf": []}
+# PDFs without labels are only reported with their decision counts.
+# The built-in LABELLED_PAGES (including TOCs without page numbers) are always checked first:
+# a TOC page must never be decided "no" locally.
+
+import argparse
+import json
+import os
+import pymupdf
+from app.core.toc_heuristics import classify_toc_page, score_toc_page
+
+# (name, page text, whether the page is a TOC page)
+LABELLED_PAGES = [
+    ('toc with dot leaders',
+     'Contents\n1 Introduction ........ 1\n2 Methods ........ 5\n2.1 Data ........ 7\n3 Results ........ 12\n4 Conclusion ........ 20',
+     True),
+    ('toc with roman front matter',
+     'Preface vii\nAcknowledgements xi\n1 Getting started 1\n2 Basic usage 15\n3 Advanced topics 42\nIndex 101',
+     True),
+    ('toc without page numbers, numbered headings',
+     '1 Introduction\n2 Methods\n2.1 Data collection\n2.2 Preprocessing\n2.3 Model\n3 Results\n3.1 Main results\n4 Conclusion',
+     True),
+    ('toc without page numbers, chapters',
+     'Chapter One… The Beginning\nChapter Two… The Middle\nChapter Three… The Turn\nChapter Four… The End\nEpilogue',
+     True),
+    ('toc without page numbers, plain headings',
+     'Introduction\nBackground and Motivation\nRelated Work\nMethod Overview\nExperimental Setup\nResults\nDiscussion\nConclusion',
+     True),
+    ('toc without page numbers, chinese',
+     '目录\n第一章 绪论\n第二章 相关工作\n第三章 方法\n第四章 实验\n第五章 结论',
+     True),
+    ('body text',
+     'The model was trained on a large corpus of documents collected from various\nsources, and we observed that '
+     'the performance improved once the data was\ncleaned and deduplicated. the gains were largest in the mid\n'
+     'range of the distribution, while the tails stayed dim and the effect on the\ncivil service corpus was small.',
+     False),
+    ('list of figures',
+     'List of Figures\n1.1 System overview ........ 3\n2.1 Data pipeline ........ 9\n3.1 Results ........ 14',
+     False),
+]
+
+
+def check_labelled_pages(low, high):
+    """
+    Classify the built-in labelled pages and report the TOC pages wrongly decided "no" locally.
+    Returns:
+        int: The number of TOC pages decided "no".
+    """
+    missed = 0
+    for name, text, is_toc in LABELLED_PAGES:
+        verdict = classify_toc_page(text, low, high)
+        wrong = (is_toc and verdict == 'no') or (not is_toc and verdict == 'yes')
+        missed += is_toc and verdict == 'no'
+        print(f"{name}: score={score_toc_page(text):.2f} verdict={verdict} toc={is_toc}" + (' WRONG' if wrong else ''))
+    return missed
+
+
+def simulate_find_toc_pages(verdicts, toc_pages, toc_check_page_num):
+    """
+    Replay the find_toc_pages scan with the labels standing in for the LLM.
+    Returns:
+        tuple: LLM calls without the pre-filter, LLM calls with it, and the TOC pages found with it.
+    """
+    baseline_calls = 0
+    filtered_calls = 0
+    found = []
+    last_page_is_yes = False
+    for page_index, verdict in enumerate(verdicts):
+        if page_index >= toc_check_page_num and not last_page_is_yes:
+            break
+        baseline_calls += 1
+        if verdict is None:
+            filtered_calls += 1
+            verdict = 'yes' if page_index in toc_pages else 'no'
+        if verdict == 'yes':
+            found.append(page_index)
+            last_page_is_yes = True
+        elif last_page_is_yes:
+            break
+    return baseline_calls, filtered_calls, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local TOC page pre-filter')
+    parser.add_argument('--pdf-dir', type=str, default=None, help='Directory of PDF files')
+    parser.add_argument('--labels', type=str, default=None, help='JSON file mapping PDF names to 0-based TOC page indices')
+    parser.add_argument('--toc-check-pages', type=int, default=20, help='Number of pages checked for a TOC')
+    parser.add_argument('--low', type=float, default=0.15, help='Score below which a page is "no"')
+    parser.add_argument('--high', type=float, default=0.8, help='Score at or above which a page is "yes"')
+    args = parser.parse_args()
+
+    missed = check_labelled_pages(args.low, args.high)
+    print(f"labelled TOC pages wrongly decided 'no': {missed}\n")
+    if not args.pdf_dir:
+        return
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+
+    totals = {'pages': 0, 'local_yes': 0, 'local_no': 0, 'ambiguous': 0,
+              'tp': 0, 'fp': 0, 'fn_skipped': 0, 'toc_pages': 0,
+              'baseline_calls': 0, 'filtered_calls': 0, 'docs': 0, 'docs_le_one_call': 0, 'docs_same_result': 0}
+
+    for filename in sorted(os.listdir(args.pdf_dir)):
+        if not filename.lower().endswith('.pdf'):
+            continue
+        doc = pymupdf.open(os.path.join(args.pdf_dir, filename))
+        page_count = min(doc.page_count, args.toc_check_pages * 2)
+        verdicts = [classify_toc_page(doc[i].get_text(), args.low, args.high) for i in range(page_count)]
+        doc.close()
+
+        local_yes = verdicts.count('yes')
+        local_no = verdicts.count('no')
+        ambiguous = verdicts.count(None)
+        totals['pages'] += len(verdicts)
+        totals['local_yes'] += local_yes
+        totals['local_no'] += local_no
+        totals['ambiguous'] += ambiguous
+        line = f'{filename}: pages={len(verdicts)} yes={local_yes} no={local_no} ambiguous={ambiguous}'
+
+        if filename in labels:
+            toc_pages = set(labels[filename])
+            totals['toc_pages'] += len(toc_pages)
+            for page_index, verdict in enumerate(verdicts):
+                if verdict == 'yes':
+                    totals['tp' if page_index in toc_pages else 'fp'] += 1
+                elif verdict == 'no' and page_index in toc_pages:
+                    totals['fn_skipped'] += 1
+
+            baseline_calls, filtered_calls, found = simulate_find_toc_pages(verdicts, toc_pages, args.toc_check_pages)
+            _, _, expected = simulate_find_toc_pages([None] * len(verdicts), toc_pages, args.toc_check_pages)
+            totals['docs'] += 1
+            totals['baseline_calls'] += baseline_calls
+            totals['filtered_calls'] += filtered_calls
+            totals['docs_le_one_call'] += filtered_calls <= 1
+            totals['docs_same_result'] += found == expected
+            line += f' | llm calls {baseline_calls} -> {filtered_calls}, same result: {found == expected}'
+        print(line)
+
+    print('\n=== Summary ===')
+    print(f"pages: {totals['pages']}, decided locally: {totals['local_yes'] + totals['local_no']} "
+          f"({(totals['local_yes'] + totals['local_no']) / max(totals['pages'], 1):.1%})")
+    if totals['docs']:
+        recall = 1 - totals['fn_skipped'] / max(totals['toc_pages'], 1)
+        print(f"TOC page recall of the pre-filter (not wrongly skipped): {recall:.1%}")
+        if totals['tp'] + totals['fp']:
+            precision = totals['tp'] / (totals['tp'] + totals['fp'])
+            print(f"precision of local 'yes' decisions: {precision:.1%}")
+        else:
+            print("precision of local 'yes' decisions: n/a (no local 'yes')")
+        print(f"LLM calls: {totals['baseline_calls']} -> {totals['filtered_calls']}")
+        print(f"documents resolved with <= 1 LLM call: {totals['docs_le_one_call']}/{totals['docs']}")
+        print(f"documents with the same TOC pages as the LLM-only scan: {totals['docs_same_result']}/{totals['docs']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@ import argparse
 import os
 import json
 from app.core.document_parser import page_index_main
-from app.utils.config_utils import config
+from app.utils.config_utils import ConfigLoader
+from app.utils.tracing_utils import Tracer
 
 if __name__ == "__main__":
     # Set up argument parser
@@ -23,10 +24,14 @@ if __name__ == "__main__":
                       help='Whether to add doc description to the doc')
     parser.add_argument('--if-add-node-text', type=str, default='no',
                       help='Whether to add text to the node')
+    parser.add_argument('--if-add-trace-report', type=str, default='no',
+                      help='Whether to add the stage timing and LLM usage report to the result')
+    parser.add_argument('--trace-file', type=str, default=None,
+                      help='Write the stage and LLM call spans to this file (OpenTelemetry OTLP/JSON)')
     args = parser.parse_args()
         
         # Configure options
-    opt = config(
+    opt = ConfigLoader().load(dict(
         model=args.model,
         toc_check_page_num=args.toc_check_pages,
         max_page_num_each_node=args.max_pages_per_node,
@@ -34,11 +39,15 @@ if __name__ == "__main__":
         if_add_node_id=args.if_add_node_id,
         if_add_node_summary=args.if_add_node_summary,
         if_add_doc_description=args.if_add_doc_description,
-        if_add_node_text=args.if_add_node_text
-    )
+        if_add_node_text=args.if_add_node_text,
+        if_add_trace_report=args.if_add_trace_report
+    ))
 
     # Process the PDF
-    toc_with_page_number = page_index_main(args.pdf_path, opt)
+    tracer = Tracer()
+    toc_with_page_number = page_index_main(args.pdf_path, opt, tracer=tracer)
+    if args.trace_file:
+        tracer.export_otlp(args.trace_file)
     print('Parsing done, saving to file...')
     
     # Save results